@@ -1,9 +1,25 @@
 import streamlit as st
 import pandas as pd
-import time
-from datetime import datetime
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
 import io
+import os
+import time
+import uuid
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from support_tagger.cache import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_PATH, ResultCache
+from support_tagger.dedup import NEAR_DUPLICATE_THRESHOLD
+from support_tagger.examples import EXAMPLE_BANK_PATH, EXAMPLES_PER_PROMPT, load_example_bank
+from support_tagger.jobs import DONE, FAILED, QUEUED, RUNNING, get_job_queue, job_eta, read_job_preview
+from support_tagger.pool import MODEL_POOL_BUDGET_BYTES, POOL_MODEL_IDS, ModelPool
+from support_tagger.results import ResultStore
+from support_tagger.server import MicroBatcher
+from support_tagger.streaming import DEFAULT_CHUNK_SIZE
+from support_tagger.student import STUDENT_CONFIDENCE, STUDENT_PATH, load_student
+from support_tagger.tagging import (
+    ALL_TAGS, DEFAULT_BATCH_SIZE, MODEL_BACKENDS, MODEL_ID, TAGGING_MODES, TICKET_TOKEN_BUDGET
+)
+from support_tagger.telemetry import TELEMETRY
 
 # ============================================================================
 # PAGE CONFIGURATION
@@ -298,20 +314,39 @@ st.markdown("""
 # MODEL LOADING AND CACHING
 # ============================================================================
 @st.cache_resource
-def load_model():
-    """Load and cache the AI model"""
-    with st.spinner("Loading AI model..."):
-        model_id = "google/flan-t5-base"
-        tokenizer = AutoTokenizer.from_pretrained(model_id)
-        model = AutoModelForSeq2SeqLM.from_pretrained(model_id)
-        tagger = pipeline("text2text-generation", model=model, tokenizer=tokenizer)
-    return tagger
+def get_model_pool():
+    """Create the pool of models shared by every backend, session and job; models load in the background"""
+    pool = ModelPool(MODEL_POOL_BUDGET_BYTES)
+    get_job_queue(cache=get_result_cache()).attach_pool(pool)
+    return pool
+
+# ============================================================================
+# RESULT CACHE
+# ============================================================================
+@st.cache_resource
+def get_result_cache():
+    """Open the result cache; entries live on disk so they survive cache clears and restarts"""
+    return ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES)
+
+result_cache = get_result_cache()
+
+# ============================================================================
+# SHARED INFERENCE QUEUE
+# ============================================================================
+# "Reset Model" clears this cache; closing the old batcher stops its scheduler thread
+@st.cache_resource(on_release=lambda batcher: batcher.close())
+def get_inference_batcher():
+    """Queue single tickets from every browser session into shared batched calls on one scheduler thread"""
+    # Short enough to go unnoticed in the UI, long enough for clicks from other sessions to join the batch
+    return MicroBatcher(None, max_batch_size=DEFAULT_BATCH_SIZE, max_wait=0.05, cache=get_result_cache())
+
+inference_batcher = get_inference_batcher()
 
 # ============================================================================
 # SESSION STATE INITIALIZATION
 # ============================================================================
 if "processed_tickets" not in st.session_state:
-    st.session_state.processed_tickets = []
+    st.session_state.processed_tickets = ResultStore()
 
 if "model_loaded" not in st.session_state:
     st.session_state.model_loaded = False
@@ -319,6 +354,9 @@ if "model_loaded" not in st.session_state:
 if "total_processed" not in st.session_state:
     st.session_state.total_processed = 0
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 # ============================================================================
 # SIDEBAR
 # ============================================================================
@@ -356,14 +394,112 @@ with st.sidebar:
             </div>
         """, unsafe_allow_html=True)
     
+    cache_stats = result_cache.stats()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown(f"""
+            <div class="metric-card">
+                <div class="metric-value">{cache_stats['hits']}</div>
+                <div class="metric-label">Cache Hits</div>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown(f"""
+            <div class="metric-card">
+                <div class="metric-value">{cache_stats['misses']}</div>
+                <div class="metric-label">Cache Misses</div>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    st.caption(f"{cache_stats['entries']} cached results ({cache_stats['evictions']} evicted)")
+    
+    batcher_stats = inference_batcher.stats()
+    if batcher_stats['batches']:
+        st.caption(
+            f"Single tickets from all sessions: {batcher_stats['requests']} in {batcher_stats['batches']} batches "
+            f"(mean {batcher_stats['mean_batch_size']:.1f}), p50 {batcher_stats['latency_p50_ms']:.0f} ms, "
+            f"p99 {batcher_stats['latency_p99_ms']:.0f} ms"
+        )
+    
+    st.markdown("---")
+    
+    # Telemetry
+    st.subheader("Telemetry")
+    st.toggle(
+        "Record stage timings",
+        value=TELEMETRY.enabled,
+        key="telemetry_enabled",
+        on_change=lambda: setattr(TELEMETRY, "enabled", st.session_state.telemetry_enabled),
+        help="Time each tagging stage and count prompt tokens. Applies to the whole app; turn off to skip the overhead"
+    )
+    sidebar_jobs = get_job_queue(cache=result_cache).list_jobs(limit=5)
+    
+    @st.fragment(run_every=2 if any(job['status'] == RUNNING for job in sidebar_jobs) else None)
+    def render_telemetry():
+        """Show throughput, job ETA and stage timing histograms, refreshing while a job runs"""
+        telemetry = TELEMETRY.snapshot()
+        running = [job for job in get_job_queue().list_jobs(limit=5) if job['status'] == RUNNING]
+        eta = job_eta(running[0]) if running else None
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown(f"""
+                <div class="metric-card">
+                    <div class="metric-value">{telemetry['tickets_per_second']:.1f}</div>
+                    <div class="metric-label">Tickets/sec</div>
+                </div>
+            """, unsafe_allow_html=True)
+        
+        with col2:
+            st.markdown(f"""
+                <div class="metric-card">
+                    <div class="metric-value">{f"{int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else "-"}</div>
+                    <div class="metric-label">Job ETA</div>
+                </div>
+            """, unsafe_allow_html=True)
+        
+        if not telemetry['stages']:
+            return
+        with st.expander("Stage timings"):
+            st.dataframe(
+                pd.DataFrame([
+                    {'stage': stage, 'calls': stats['count'], 'total s': round(stats['total_seconds'], 2),
+                     'mean ms': round(stats['mean_ms'], 1), 'p95 ms': stats['p95_ms']}
+                    for stage, stats in telemetry['stages'].items()
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
+            stage = st.selectbox("Histogram", list(telemetry['stages']))
+            buckets = telemetry['stages'][stage]['buckets']
+            labels = [f"<= {float(bound) * 1000:g} ms" if bound != "+Inf" else "slower" for bound in buckets]
+            st.bar_chart(pd.DataFrame({
+                'bucket': pd.Categorical(labels, categories=labels, ordered=True),
+                'calls': list(buckets.values())
+            }), x="bucket", y="calls")
+            tokens = telemetry['prompt_tokens']
+            if tokens['count']:
+                st.caption(
+                    f"Prompt length: mean {tokens['mean']:.0f} tokens, p95 <= {tokens['p95']} tokens · "
+                    f"{telemetry['tickets_clipped']} tickets clipped to the token budget"
+                )
+            st.download_button(
+                "Download Prometheus metrics",
+                TELEMETRY.prometheus(),
+                file_name="support_tagger_metrics.prom",
+                mime="text/plain",
+                use_container_width=True
+            )
+    
+    render_telemetry()
+    
     st.markdown("---")
     
     # Available tags
     st.subheader("Available Tags")
-    all_tags = ["internet", "account", "payment", "technical", "login", "error", "server", "website", "reset", "password", "connectivity", "crash"]
-    
     tag_cols = st.columns(3)
-    for i, tag in enumerate(all_tags):
+    for i, tag in enumerate(ALL_TAGS):
         with tag_cols[i % 3]:
             st.markdown(f'<span class="status-indicator" style="background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%); margin: 0.1rem; font-size: 0.7rem;">{tag}</span>', unsafe_allow_html=True)
     
@@ -373,9 +509,56 @@ with st.sidebar:
     st.subheader("Controls")
     
     if st.button("Clear Results", use_container_width=True):
-        st.session_state.processed_tickets = []
+        st.session_state.processed_tickets.clear()
         st.rerun()
     
+    backend = st.selectbox(
+        "Inference backend",
+        list(MODEL_BACKENDS),
+        format_func={"torch": "PyTorch fp32", "int8": "PyTorch int8", "onnx": "ONNX Runtime"}.get,
+        help="int8 quantizes the model's linear layers; ONNX Runtime needs optimum[onnxruntime] installed"
+    )
+    
+    model_id = st.selectbox(
+        "Model",
+        POOL_MODEL_IDS,
+        index=POOL_MODEL_IDS.index(MODEL_ID),
+        format_func=lambda model: model.split("/")[-1],
+        help="Models already in the pool switch instantly; new ones load in the background"
+    )
+    preload_id = st.selectbox(
+        "Preload next model",
+        [None, *(model for model in POOL_MODEL_IDS if model != model_id)],
+        format_func=lambda model: "None" if model is None else model.split("/")[-1],
+        help="Load another model in the background so switching to it later is instant"
+    )
+    
+    model_pool = get_model_pool()
+    if Runtime.exists():
+        # Sessions whose browser tab has closed stop holding their model
+        for holder in model_pool.holders():
+            if not Runtime.instance().is_active_session(holder):
+                model_pool.release(holder)
+    # Each session pins its own model, so sessions on different models do not evict each other's
+    model_loader = model_pool.activate(
+        model_id, preload=preload_id, backend=backend, holder=get_script_run_ctx().session_id
+    )
+    startup = model_loader.timings()
+    if 'load_seconds' in startup:
+        st.caption(
+            f"Loaded in {startup['load_seconds']:.1f}s"
+            + (f" · warmup {startup['warmup_seconds']:.1f}s" if 'warmup_seconds' in startup else "")
+            + (f" · first tag after {startup['time_to_first_tag_seconds']:.1f}s" if 'time_to_first_tag_seconds' in startup else "")
+        )
+    
+    for model in model_pool.stats()['models']:
+        st.caption(
+            f"{model['model_id'].split('/')[-1]} ({model['backend']}) · {model['state']}"
+            + (" · active" if model['active'] else " · pinned" if model['pinned'] else "")
+            + (f" · {model['resident_bytes'] / 1024 ** 2:.0f} MB" if model['resident_bytes'] is not None else "")
+            + (f" · loaded in {model['load_seconds']:.1f}s" if model['load_seconds'] is not None else "")
+        )
+    
     if st.button("Reset Model", use_container_width=True):
         st.cache_resource.clear()
         st.session_state.model_loaded = False
@@ -393,112 +576,22 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-# Load model
-try:
-    tagger = load_model()
-    st.session_state.model_loaded = True
-except Exception as e:
-    st.error(f"Error loading model: {str(e)}")
+# Model status; the model itself loads in the background (see get_model_pool)
+if model_loader.error is not None:
+    st.error(f"Error loading model: {str(model_loader.error)}")
     st.stop()
+st.session_state.model_loaded = model_loader.ready
+job_queue = get_job_queue(cache=result_cache)
 
-# ============================================================================
-# TAGGING FUNCTIONS
-# ============================================================================
-# Predefined tag set
-ALL_TAGS = ["internet", "account", "payment", "technical", "login", "error", "server", "website", "reset", "password", "connectivity", "crash"]
-
-def zero_shot_prompt(text):
-    """Generate a zero-shot prompt for ticket classification"""
-    return (
-        f"Classify this support ticket by selecting exactly 3 tags from the following list: {', '.join(ALL_TAGS)}. "
-        f"Choose the most relevant tags based on the ticket's content. Return only the 3 tags separated by commas, no additional text. "
-        f"Ticket: '{text}'"
-    )
-
-def few_shot_prompt(text):
-    """Generate a few-shot prompt with diverse examples for ticket classification"""
-    return (
-        "Classify support tickets by selecting exactly 3 tags from the following list: "
-        f"{', '.join(ALL_TAGS)}. Return only the 3 tags separated by commas, no additional text.\n\n"
-        "Example 1:\n"
-        "Ticket: I forgot my password and can't log in.\n"
-        "Tags: login, account, reset\n\n"
-        "Example 2:\n"
-        "Ticket: Website keeps crashing with error 500.\n"
-        "Tags: website, error, server\n\n"
-        "Example 3:\n"
-        "Ticket: Payment failed but money was charged.\n"
-        "Tags: payment, error, account\n\n"
-        "Example 4:\n"
-        "Ticket: My internet connection has been down since yesterday.\n"
-        "Tags: internet, technical, connectivity\n\n"
-        f"Ticket: {text}\n"
-        "Tags:"
-    )
+@st.fragment(run_every=1 if not model_loader.ready else None)
+def render_model_loading():
+    """Show a notice while the model loads, then rerun the page so the status updates"""
+    if model_loader.ready != st.session_state.model_loaded or model_loader.error is not None:
+        st.rerun()
+    if not model_loader.ready:
+        st.info("Loading the AI model in the background. CSV files can be queued in the meantime.")
 
-def process_ticket(text):
-    """Process a single ticket and return results with exactly 3 valid tags"""
-    def validate_and_fix_tags(tags, text):
-        """Validate and fix tags to ensure exactly 3 valid tags"""
-        # Split and clean tags
-        tag_list = [tag.strip().lower() for tag in tags.split(",") if tag.strip()]
-        # Filter valid tags
-        valid_tags = [tag for tag in tag_list if tag in ALL_TAGS]
-        
-        # If fewer than 3 tags, add relevant ones based on keywords
-        if len(valid_tags) < 3:
-            keyword_mappings = {
-                "internet": ["internet", "connection", "wifi", "network"],
-                "account": ["account", "profile", "user"],
-                "payment": ["payment", "billing", "charge", "transaction"],
-                "technical": ["technical", "issue", "problem", "not working"],
-                "login": ["login", "log in", "sign in", "access"],
-                "error": ["error", "crash", "failed", "issue"],
-                "server": ["server", "500", "down"],
-                "website": ["website", "site", "page"],
-                "reset": ["reset", "password", "recover"],
-                "password": ["password", "pass"],
-                "connectivity": ["connectivity", "connection", "internet"],
-                "crash": ["crash", "crashes", "crashing"]
-            }
-            
-            # Convert text to lowercase for keyword matching
-            text_lower = text.lower()
-            # Find matching tags based on keywords
-            matched_tags = []
-            for tag, keywords in keyword_mappings.items():
-                if any(keyword in text_lower for keyword in keywords):
-                    if tag not in valid_tags and tag not in matched_tags:
-                        matched_tags.append(tag)
-            
-            # Add matched tags to valid_tags, avoiding duplicates
-            for tag in matched_tags:
-                if tag not in valid_tags and len(valid_tags) < 3:
-                    valid_tags.append(tag)
-            
-            # If still fewer than 3 tags, fill with default tags
-            default_tags = ["error", "technical", "issue"]
-            for tag in default_tags:
-                if tag in ALL_TAGS and tag not in valid_tags and len(valid_tags) < 3:
-                    valid_tags.append(tag)
-        
-        # Ensure exactly 3 tags
-        return ", ".join(valid_tags[:3])
-
-    # Generate tags using the model
-    zs_tags = tagger(zero_shot_prompt(text), max_new_tokens=20, do_sample=False)[0]['generated_text']
-    fs_tags = tagger(few_shot_prompt(text), max_new_tokens=20, do_sample=False)[0]['generated_text']
-    
-    # Validate and fix tags
-    zs_tags = validate_and_fix_tags(zs_tags, text)
-    fs_tags = validate_and_fix_tags(fs_tags, text)
-    
-    return {
-        'text': text,
-        'zero_shot': zs_tags,
-        'few_shot': fs_tags,
-        'timestamp': datetime.now().strftime("%H:%M:%S")
-    }
+render_model_loading()
 
 # ============================================================================
 # FILE UPLOAD AND PROCESSING
@@ -519,13 +612,118 @@ manual_ticket = st.text_area(
     height=100
 )
 
+batch_size = st.slider(
+    "Batch size",
+    min_value=1,
+    max_value=64,
+    value=DEFAULT_BATCH_SIZE,
+    help="Number of prompts sent to the model per generate call when processing a CSV file"
+)
+
+token_budget = st.number_input(
+    "Ticket token budget",
+    min_value=0,
+    value=TICKET_TOKEN_BUDGET,
+    step=32,
+    help="Most tokens of a ticket sent to the model. Longer tickets, such as pasted logs, keep their start and end "
+         "and are marked as clipped. 0 sends every token"
+) or None
+
+use_student = st.checkbox(
+    "Answer confident tickets with the student model",
+    disabled=not os.path.exists(STUDENT_PATH),
+    help="A small classifier distilled from earlier results tags the tickets it is sure about without the model. "
+         f"Train it with `python -m support_tagger.student train`, which saves {STUDENT_PATH}"
+)
+student_confidence = st.slider(
+    "Student confidence",
+    min_value=0.5,
+    max_value=0.99,
+    value=STUDENT_CONFIDENCE,
+    step=0.01,
+    disabled=not use_student,
+    help="Tickets the student is less sure about than this are sent to the model"
+)
+student = load_student(STUDENT_PATH, student_confidence) if use_student else None
+
+with st.expander("CSV job options"):
+    st.caption(
+        "CSV files are tagged in the background. Rows are read in chunks and written to disk as each "
+        "chunk finishes, and an interrupted job resumes from its last completed chunk."
+    )
+    job_col1, job_col2 = st.columns(2)
+    with job_col1:
+        chunk_size = st.number_input("Chunk size (rows)", min_value=1, value=DEFAULT_CHUNK_SIZE, step=100)
+    with job_col2:
+        output_format = st.selectbox("Output format", options=["csv", "parquet"])
+    group_near_duplicates = st.checkbox(
+        "Group near-duplicate tickets",
+        help="Tickets worded almost the same (e.g. during an outage) are tagged once and share the tags"
+    )
+    near_duplicate_threshold = st.slider(
+        "Similarity threshold",
+        min_value=0.3,
+        max_value=1.0,
+        value=NEAR_DUPLICATE_THRESHOLD,
+        step=0.05,
+        disabled=not group_near_duplicates,
+        help="Higher values only group tickets that are closer to identical"
+    )
+
+tagging_mode = st.radio(
+    "Tagging mode",
+    options=list(TAGGING_MODES),
+    format_func=lambda mode: {
+        "generate": "Generate tags", "constrained": "Constrained generation", "score": "Rank all tags",
+        "greedy-assisted": "Greedy assisted generation"
+    }[mode],
+    horizontal=True,
+    help="Constrained generation only lets the model write tags from the list and stops after 3. "
+         "Rank all tags scores every tag in one pass and reports confidence instead of generating free text. "
+         "Greedy assisted generation decodes greedily instead of with beam search, so its tags can differ from "
+         "Generate tags; flan-t5-small drafts tokens for the model to check, which is faster on CPU when most "
+         "drafts are accepted. The draft model loads on first use"
+)
+
+adaptive = st.checkbox(
+    "Skip few-shot when zero-shot is confirmed",
+    help="Run the zero-shot prompt first and the longer few-shot prompt only when the zero-shot tags needed repair "
+         "or are not confirmed by the ticket's keywords. Skipped tickets reuse the zero-shot tags"
+)
+
+retrieve_examples = st.checkbox(
+    "Pick few-shot examples by similarity",
+    help=f"Show each few-shot prompt only the examples most similar to its ticket, from {EXAMPLE_BANK_PATH} "
+         "(grow it with `python -m support_tagger.examples add`) or the 4 fixed examples until it exists"
+)
+examples_k = st.slider(
+    "Examples per prompt",
+    min_value=1,
+    max_value=4,
+    value=EXAMPLES_PER_PROMPT,
+    disabled=not retrieve_examples
+)
+example_bank = load_example_bank(EXAMPLE_BANK_PATH, examples_k) if retrieve_examples else None
+few_shot_tokens = TELEMETRY.snapshot()['few_shot_tokens']
+if retrieve_examples and few_shot_tokens['prompts']:
+    st.caption(
+        f"Few-shot prompts: {few_shot_tokens['retrieved_mean']:.0f} tokens on average with retrieved examples, "
+        f"{few_shot_tokens['fixed_mean']:.0f} with the fixed examples ({len(example_bank)} examples in the bank)"
+    )
+
 col1, col2 = st.columns(2)
 with col1:
     if st.button("Process Single Ticket", disabled=not manual_ticket.strip()):
         if manual_ticket.strip():
             with st.spinner("Processing ticket..."):
-                result = process_ticket(manual_ticket.strip())
-                st.session_state.processed_tickets.append(result)
+                # Coalesced with tickets from other sessions into one batched call on the shared scheduler thread
+                result = inference_batcher.tag(
+                    manual_ticket.strip(), session=st.session_state.session_id, tagger=model_loader.wait(),
+                    mode=tagging_mode, token_budget=token_budget, student=student, adaptive=adaptive,
+                    example_bank=example_bank
+                )
+                model_loader.record_first_tag()
+                st.session_state.processed_tickets.add(result)
                 st.session_state.total_processed += 1
                 st.success("Ticket processed successfully!")
                 st.rerun()
@@ -534,49 +732,119 @@ with col2:
     if st.button("Process CSV File", disabled=uploaded_file is None):
         if uploaded_file is not None:
             try:
-                df = pd.read_csv(uploaded_file)
-                
-                if 'ticket_text' not in df.columns:
+                data = uploaded_file.getvalue()
+                if 'ticket_text' not in pd.read_csv(io.BytesIO(data), nrows=0).columns:
                     st.error("CSV must contain a 'ticket_text' column")
                 else:
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    for i, row in df.iterrows():
-                        progress = (i + 1) / len(df)
-                        progress_bar.progress(progress)
-                        status_text.text(f"Processing ticket {i + 1} of {len(df)}...")
-                        
-                        result = process_ticket(row['ticket_text'])
-                        st.session_state.processed_tickets.append(result)
-                        st.session_state.total_processed += 1
-                        
-                        time.sleep(0.1)  # Small delay for visual feedback
-                    
-                    progress_bar.empty()
-                    status_text.empty()
-                    st.success(f"Successfully processed {len(df)} tickets!")
-                    st.rerun()
+                    job_id = job_queue.submit(
+                        uploaded_file.name,
+                        data,
+                        batch_size=batch_size,
+                        mode=tagging_mode,
+                        chunk_size=int(chunk_size),
+                        output_format=output_format,
+                        near_duplicate_threshold=near_duplicate_threshold if group_near_duplicates else None,
+                        token_budget=token_budget,
+                        student_path=STUDENT_PATH if use_student else None,
+                        student_confidence=student_confidence if use_student else None,
+                        adaptive=adaptive,
+                        example_bank_path=EXAMPLE_BANK_PATH if retrieve_examples else None,
+                        examples_k=examples_k if retrieve_examples else None,
+                        model_id=model_id,
+                        backend=backend
+                    )
+                    st.success(f"Queued job {job_id} for {uploaded_file.name}")
                     
             except Exception as e:
                 st.error(f"Error processing file: {str(e)}")
 
 # ============================================================================
-# RESULTS DISPLAY
+# BACKGROUND JOBS
 # ============================================================================
-st.subheader("Processing Results")
+recent_jobs = job_queue.list_jobs(limit=5)
+jobs_active = any(job['status'] in (QUEUED, RUNNING) for job in recent_jobs)
 
-if not st.session_state.processed_tickets:
-    st.markdown("""
-        <div class="welcome-message">
-            <h2>Welcome to AI Ticket Tagger!</h2>
-            <p>Upload a CSV file or enter a single ticket to get started.</p>
-            <p>The AI will automatically classify your support tickets using both zero-shot and few-shot learning approaches.</p>
-        </div>
-    """, unsafe_allow_html=True)
-else:
-    # Display processed tickets
-    for i, ticket in enumerate(reversed(st.session_state.processed_tickets[-10:])):  # Show last 10
+@st.fragment(run_every=2 if jobs_active else None)
+def render_jobs():
+    """Show recent CSV jobs, polling while any of them is still queued or running"""
+    jobs = job_queue.list_jobs(limit=5)
+    if not jobs:
+        return
+    st.subheader("CSV Jobs")
+    for job in jobs:
+        st.markdown(
+            f"**{job['name']}** · `{job['id']}` · {job['status']}"
+            + (f" · {job['options']['model_id'].split('/')[-1]}" if job['options'].get('model_id') else "")
+        )
+        if job['status'] == RUNNING:
+            eta = job_eta(job)
+            st.progress(
+                job['progress'],
+                text=f"Tagged {job['rows_done']} rows..." + (f" about {eta:.0f}s left" if eta is not None else "")
+            )
+        elif job['status'] == DONE:
+            st.caption(f"Tagged {job['rows_done']} rows. Results written to {job['output_path']}")
+        elif job['status'] == FAILED:
+            st.error(f"Job failed: {job['error']}")
+        if job['stats'].get('model_calls_saved'):
+            st.caption(
+                f"Near-duplicate grouping saved {job['stats']['model_calls_saved']} of "
+                f"{job['stats']['tickets']} model calls"
+            )
+        if job['stats'].get('tickets_clipped'):
+            st.caption(f"{job['stats']['tickets_clipped']} long tickets were clipped to the token budget")
+        if 'routed_fraction' in job['stats']:
+            st.caption(
+                f"The student answered {job['stats']['student_answered']} tickets; "
+                f"{job['stats']['routed_fraction']:.0%} were routed to the model"
+            )
+        if job['stats'].get('few_shot_skipped'):
+            st.caption(f"Skipped the few-shot prompt for {job['stats']['few_shot_skipped']} tickets")
+        if job['status'] in (RUNNING, DONE):
+            preview = read_job_preview(job)
+            if not preview.empty:
+                st.dataframe(preview, use_container_width=True, hide_index=True)
+    # Switch back to a full rerun so polling stops once the last job finishes
+    if not any(job['status'] in (QUEUED, RUNNING) for job in jobs) and jobs_active:
+        st.rerun()
+
+render_jobs()
+
+# ============================================================================
+# RESULTS DISPLAY
+# ============================================================================
+@st.fragment
+def render_results():
+    """Show one page of results; paging reruns only this fragment, not the model loading and styling"""
+    results = st.session_state.processed_tickets
+    st.subheader("Processing Results")
+    
+    if not len(results):
+        st.markdown("""
+            <div class="welcome-message">
+                <h2>Welcome to AI Ticket Tagger!</h2>
+                <p>Upload a CSV file or enter a single ticket to get started.</p>
+                <p>The AI will automatically classify your support tickets using both zero-shot and few-shot learning approaches.</p>
+            </div>
+        """, unsafe_allow_html=True)
+        return
+    
+    page_col1, page_col2, page_col3 = st.columns([1, 1, 2])
+    with page_col1:
+        page_size = st.selectbox("Results per page", options=[10, 25, 50], key="results_page_size")
+    page_count = results.page_count(page_size)
+    # Keep the page in range when the page size grows or results are cleared
+    st.session_state.results_page = min(st.session_state.get("results_page", 1), page_count)
+    with page_col2:
+        page = st.number_input("Page", min_value=1, max_value=page_count, key="results_page")
+    with page_col3:
+        st.caption(
+            f"{len(results)} results, newest first"
+            + (f" · {results.spilled} older results are kept on disk" if results.spilled else "")
+        )
+    
+    render_start = time.perf_counter()
+    for ticket in results.page(page - 1, page_size):
         with st.container():
             st.markdown(f"""
                 <div style="
@@ -598,16 +866,32 @@ else:
             with col1:
                 st.markdown("**🔹 Zero-shot Tags:**")
                 st.code(ticket['zero_shot'])
+                if 'zero_shot_scores' in ticket:
+                    scores = ticket['zero_shot_scores']
+                    st.caption(" · ".join(f"{tag} {scores[tag]:.2f}" for tag in ticket['zero_shot'].split(", ")))
             
             with col2:
                 st.markdown("**🔸 Few-shot Tags:**")
                 st.code(ticket['few_shot'])
+                if 'few_shot_scores' in ticket:
+                    scores = ticket['few_shot_scores']
+                    st.caption(" · ".join(f"{tag} {scores[tag]:.2f}" for tag in ticket['few_shot'].split(", ")))
+                if ticket.get('few_shot_skipped'):
+                    st.caption("Few-shot prompt skipped: the zero-shot tags were confirmed by keywords")
             
-            st.caption(f"Processed at {ticket['timestamp']}")
+            st.caption(
+                f"Processed at {ticket['timestamp']}"
+                + (f" · clipped {ticket['clipped_tokens']} tokens over the budget" if ticket.get('clipped_tokens') else "")
+                + (
+                    f" · tagged by the student (confidence {ticket['student_confidence']:.2f})"
+                    if ticket.get('tagged_by') == "student" else ""
+                )
+            )
             st.markdown("---")
-    
-    if len(st.session_state.processed_tickets) > 10:
-        st.info(f"Showing last 10 results. Total processed: {len(st.session_state.processed_tickets)}")
+    if TELEMETRY.enabled:
+        TELEMETRY.observe("render", time.perf_counter() - render_start)
+
+render_results()
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,11 @@
+"""Support ticket tagging with Flan-T5, usable from the Streamlit app or headless"""
+from support_tagger.tagging import (
+    ALL_TAGS,
+    MODEL_BACKENDS,
+    MODEL_ID,
+    TAGGING_MODES,
+    TICKET_TOKEN_BUDGET,
+    load_model,
+    process_ticket,
+    process_tickets,
+)
@@ -0,0 +1,109 @@
+"""Measure assisted generation against the model decoding greedily on its own
+
+For each prompt type, every ticket is decoded twice with greedy search: by the
+model alone and with the draft model proposing tokens. The report gives the
+share of identical outputs, the speedup, and how many drafted tokens the model
+accepted.
+
+Usage:
+    python -m support_tagger.assisted --input tickets.csv --limit 50
+"""
+import argparse
+import contextlib
+import json
+import time
+
+import pandas as pd
+
+from support_tagger.cli import add_tagging_arguments
+from support_tagger.tagging import (
+    DRAFT_MODEL_ID, GENERATION_KWARGS, MODEL_BACKENDS, MODEL_ID, TICKET_TOKEN_BUDGET, draft_model, load_model,
+    prompt_encoder
+)
+
+@contextlib.contextmanager
+def _count_forward_calls(model, counts, key):
+    """Count calls to a model's forward under `counts[key]` while the block runs"""
+    def count(module, args, output):
+        counts[key] += 1
+    
+    handle = model.register_forward_hook(count)
+    try:
+        yield
+    finally:
+        handle.remove()
+
+def _decode(tagger, ids, **generate_kwargs):
+    """Greedily decode one prompt; returns the generated ids and the seconds taken"""
+    import torch
+    
+    inputs = torch.tensor([ids], device=tagger.model.device)
+    start = time.perf_counter()
+    with torch.no_grad():
+        output_ids = tagger.model.generate(
+            input_ids=inputs, attention_mask=torch.ones_like(inputs),
+            generation_config=getattr(tagger, "generation_config", None), **GENERATION_KWARGS, num_beams=1,
+            **generate_kwargs
+        )
+    return output_ids[0].tolist(), time.perf_counter() - start
+
+def measure_assisted(tagger, texts, token_budget=TICKET_TOKEN_BUDGET):
+    """Decode every prompt with and without the draft model and report agreement, speedup and acceptance per prompt type
+    
+    Each model forward call during decoding verifies the pending draft tokens
+    and adds one token of its own, so the drafted tokens accepted are the new
+    tokens minus the model's forward calls.
+    """
+    assistant = draft_model(tagger)
+    input_ids, _ = prompt_encoder(tagger).encode(texts, token_budget)
+    # One untimed prompt so lazy initialisation does not count against either side
+    _decode(tagger, input_ids[0])
+    _decode(tagger, input_ids[0], assistant_model=assistant)
+    
+    report = {}
+    n = len(texts)
+    for prompt_type, prompts in (('zero_shot', input_ids[:n]), ('few_shot', input_ids[n:])):
+        counts = {'model': 0, 'draft': 0}
+        greedy_seconds = assisted_seconds = 0.0
+        identical = new_tokens = accepted = 0
+        for ids in prompts:
+            greedy, seconds = _decode(tagger, ids)
+            greedy_seconds += seconds
+            model_calls = counts['model']
+            with _count_forward_calls(tagger.model, counts, 'model'), _count_forward_calls(assistant, counts, 'draft'):
+                assisted, seconds = _decode(tagger, ids, assistant_model=assistant)
+            assisted_seconds += seconds
+            identical += assisted == greedy
+            # The first id is the decoder start token, not a generated one
+            new_tokens += len(assisted) - 1
+            accepted += max(0, len(assisted) - 1 - (counts['model'] - model_calls))
+        report[prompt_type] = {
+            'prompts': len(prompts),
+            'identical': identical / max(1, len(prompts)),
+            'greedy_seconds': greedy_seconds,
+            'assisted_seconds': assisted_seconds,
+            'speedup': greedy_seconds / assisted_seconds if assisted_seconds > 0 else 0.0,
+            'drafted_tokens': counts['draft'],
+            'accepted_tokens': accepted,
+            'acceptance_rate': accepted / counts['draft'] if counts['draft'] else 0.0,
+            'tokens_per_model_call': new_tokens / counts['model'] if counts['model'] else 0.0
+        }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare assisted generation with the model decoding on its own")
+    parser.add_argument("--input", default="tickets.csv", help="CSV with a 'ticket_text' column")
+    parser.add_argument("--limit", type=int, default=50, help="Tickets to decode (default: 50)")
+    parser.add_argument("--model", default=MODEL_ID, help="Model id or local path")
+    parser.add_argument("--draft-model", default=DRAFT_MODEL_ID, help="Draft model id or local path")
+    parser.add_argument("--backend", choices=list(MODEL_BACKENDS), default="torch", help="Inference backend")
+    add_tagging_arguments(parser, adaptive=False, student=False, examples=False)
+    args = parser.parse_args(argv)
+    
+    texts = pd.read_csv(args.input)['ticket_text'].astype(str).head(args.limit).tolist()
+    tagger = load_model(args.model, backend=args.backend, draft_model_id=args.draft_model)
+    report = measure_assisted(tagger, texts, token_budget=args.token_budget or None)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
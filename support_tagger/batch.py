@@ -0,0 +1,230 @@
+"""Headless batch tagging of CSV files with a pool of forked worker processes
+
+Usage:
+    python -m support_tagger.batch tickets.csv tickets_tagged.csv --workers 4
+"""
+import argparse
+import functools
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from support_tagger.cache import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_PATH, ResultCache
+from support_tagger.cli import add_tagging_arguments
+from support_tagger.dedup import NEAR_DUPLICATE_THRESHOLD, NearDuplicateGrouper
+from support_tagger.examples import EXAMPLES_PER_PROMPT, load_example_bank
+from support_tagger.streaming import DEFAULT_CHUNK_SIZE, stream_tickets
+from support_tagger.student import load_student
+from support_tagger.tagging import (
+    DEFAULT_BATCH_SIZE, DRAFT_MODEL_ID, MODEL_BACKENDS, MODEL_ID, TAGGING_MODES, TICKET_TOKEN_BUDGET, load_model,
+    process_tickets
+)
+from support_tagger.telemetry import TELEMETRY
+
+# Loaded in the parent before the pool is created, so forked workers share the
+# weights copy-on-write instead of each loading their own copy
+_tagger = None
+_student = None
+_example_bank = None
+_worker_cache = None
+_worker_near_duplicates = None
+
+def _init_worker(threads, cache_path, near_duplicate_threshold=None):
+    """Cap torch threads and open a per-process cache connection and near-duplicate grouper in a worker"""
+    global _worker_cache, _worker_near_duplicates
+    import torch
+    
+    torch.set_num_threads(threads)
+    _worker_cache = ResultCache(cache_path, RESULT_CACHE_MAX_ENTRIES) if cache_path else None
+    _worker_near_duplicates = NearDuplicateGrouper(near_duplicate_threshold) if near_duplicate_threshold else None
+
+def _tag_shard(shard, batch_size, mode, token_budget, adaptive):
+    """Tag one shard of ticket texts inside a worker"""
+    return process_tickets(
+        _tagger, shard, batch_size=batch_size, mode=mode, cache=_worker_cache, near_duplicates=_worker_near_duplicates,
+        token_budget=token_budget, student=_student, adaptive=adaptive, example_bank=_example_bank
+    )
+
+def _split(items, parts):
+    """Split a list into at most `parts` contiguous shards of near-equal size"""
+    size = max(1, -(-len(items) // parts))
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+def tag_csv(input_path, output_path, workers=1, threads=None, batch_size=DEFAULT_BATCH_SIZE,
+            chunk_size=DEFAULT_CHUNK_SIZE, mode="generate", model_id=MODEL_ID, backend="torch",
+            cache_path=RESULT_CACHE_PATH, near_duplicate_threshold=None, token_budget=TICKET_TOKEN_BUDGET,
+            draft_model_id=DRAFT_MODEL_ID, student_path=None, student_confidence=None, adaptive=False,
+            example_bank_path=None, examples_k=EXAMPLES_PER_PROMPT, log=print):
+    """Tag every row of `input_path` into `output_path` and return throughput statistics
+    
+    Each chunk of rows is split across `workers` processes forked after the
+    model is loaded. Every worker runs with `threads` torch threads, by default
+    the CPU count divided evenly between workers. Output is written and
+    checkpointed per chunk, so an interrupted run resumes on the next call.
+    With a `near_duplicate_threshold`, near-duplicates within each worker's
+    shard of a chunk share one model call. In "greedy-assisted" mode the draft model
+    is loaded with the model, so forked workers share it too, as are the
+    student loaded from `student_path` at `student_confidence` and the bank
+    loaded from `example_bank_path` with `examples_k` examples per prompt.
+    These, `token_budget` and `adaptive` are passed to process_tickets.
+    """
+    global _tagger, _student, _example_bank
+    
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        log("Forked workers are not supported on this platform; running in a single process")
+        workers = 1
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    output_format = "parquet" if output_path.endswith(".parquet") else "csv"
+    
+    load_start = time.perf_counter()
+    _tagger = load_model(model_id, backend=backend, draft_model_id=draft_model_id if mode == "greedy-assisted" else None)
+    load_time = time.perf_counter() - load_start
+    log(f"Loaded {model_id} ({backend}) in {load_time:.1f}s")
+    _student = load_student(student_path, student_confidence) if student_path else None
+    _example_bank = load_example_bank(example_bank_path, examples_k) if example_bank_path else None
+    
+    def report(rows_done, fraction):
+        log(f"Tagged {rows_done} rows ({fraction:.0%} of input read)")
+    
+    model_calls_saved = 0
+    tickets_clipped = 0
+    student_answered = 0
+    few_shot_skipped = 0
+    
+    def counted(results):
+        nonlocal model_calls_saved, tickets_clipped, student_answered, few_shot_skipped
+        model_calls_saved += sum('near_duplicate_of' in result for result in results)
+        tickets_clipped += sum('clipped_tokens' in result for result in results)
+        student_answered += sum(result.get('tagged_by') == "student" for result in results)
+        few_shot_skipped += sum(bool(result.get('few_shot_skipped')) for result in results)
+        return results
+    
+    tag_start = time.perf_counter()
+    with open(input_path, "rb") as source:
+        if workers == 1:
+            _init_worker(threads, cache_path, near_duplicate_threshold)
+            tag_shard = functools.partial(
+                _tag_shard, batch_size=batch_size, mode=mode, token_budget=token_budget, adaptive=adaptive
+            )
+            rows_done, rows_tagged, _ = stream_tickets(
+                source, output_path, lambda texts, progress: counted(tag_shard(texts)), output_format=output_format,
+                chunk_size=chunk_size, progress_callback=report
+            )
+        else:
+            # Avoid the tokenizers library's thread pool misbehaving after fork
+            os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+            context = multiprocessing.get_context("fork")
+            initargs = (threads, cache_path, near_duplicate_threshold)
+            with context.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+                tag_shard = functools.partial(
+                    _tag_shard, batch_size=batch_size, mode=mode, token_budget=token_budget, adaptive=adaptive
+                )
+                
+                def tag_chunk(texts, progress):
+                    shards = pool.map(tag_shard, _split(texts, workers))
+                    return counted([result for shard in shards for result in shard])
+                
+                rows_done, rows_tagged, _ = stream_tickets(
+                    source, output_path, tag_chunk, output_format=output_format, chunk_size=chunk_size,
+                    progress_callback=report
+                )
+    tag_time = time.perf_counter() - tag_start
+    
+    return {
+        'rows': rows_done,
+        'rows_tagged': rows_tagged,
+        'workers': workers,
+        'threads_per_worker': threads,
+        'load_seconds': load_time,
+        'tag_seconds': tag_time,
+        'tickets_per_second': rows_tagged / tag_time if tag_time > 0 else 0.0,
+        'model_calls_saved': model_calls_saved,
+        'tickets_clipped': tickets_clipped,
+        'student_answered': student_answered,
+        'routed_fraction': 1 - student_answered / rows_tagged if rows_tagged else 0.0,
+        'few_shot_skipped': few_shot_skipped
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tag a CSV of support tickets without the Streamlit UI")
+    parser.add_argument("input", help="CSV file with a 'ticket_text' column")
+    parser.add_argument("output", help="Output CSV file, or a .parquet directory")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Torch threads per worker (default: CPU count divided by workers)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Prompts per generate call")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows read and checkpointed at a time")
+    parser.add_argument("--mode", choices=list(TAGGING_MODES), default="generate", help="Tagging mode")
+    parser.add_argument("--model", default=MODEL_ID, help="Model id or local path")
+    parser.add_argument("--backend", choices=list(MODEL_BACKENDS), default="torch", help="Inference backend")
+    parser.add_argument("--draft-model", default=DRAFT_MODEL_ID, help="Draft model id or local path for --mode greedy-assisted")
+    parser.add_argument("--cache", default=RESULT_CACHE_PATH, help="Result cache path")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the result cache")
+    parser.add_argument("--near-duplicates", nargs="?", type=float, const=NEAR_DUPLICATE_THRESHOLD, default=None,
+                        metavar="THRESHOLD",
+                        help=f"Tag one ticket per group of near-duplicates at this similarity "
+                             f"(default when given: {NEAR_DUPLICATE_THRESHOLD})")
+    add_tagging_arguments(parser)
+    parser.add_argument("--no-telemetry", action="store_true", help="Do not record per-stage timings")
+    parser.add_argument("--telemetry-log", action="store_true",
+                        help="Write a JSON line per tagged batch to stderr and per-stage timings at the end")
+    args = parser.parse_args(argv)
+    
+    TELEMETRY.enabled = not args.no_telemetry
+    if args.telemetry_log:
+        logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    
+    stats = tag_csv(
+        args.input,
+        args.output,
+        workers=args.workers,
+        threads=args.threads,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        mode=args.mode,
+        model_id=args.model,
+        backend=args.backend,
+        draft_model_id=args.draft_model,
+        student_path=args.student,
+        student_confidence=args.student_confidence,
+        adaptive=args.adaptive,
+        example_bank_path=args.examples,
+        examples_k=args.examples_k,
+        cache_path=None if args.no_cache else args.cache,
+        near_duplicate_threshold=args.near_duplicates,
+        token_budget=args.token_budget or None,
+        log=lambda message: print(message, file=sys.stderr)
+    )
+    
+    if stats['rows_tagged'] < stats['rows']:
+        print(f"Resumed from checkpoint: {stats['rows'] - stats['rows_tagged']} rows were already tagged")
+    print(
+        f"Tagged {stats['rows_tagged']} tickets in {stats['tag_seconds']:.1f}s "
+        f"({stats['tickets_per_second']:.2f} tickets/sec) with {stats['workers']} worker(s) "
+        f"x {stats['threads_per_worker']} thread(s)"
+    )
+    if args.near_duplicates:
+        print(f"Near-duplicate grouping saved {stats['model_calls_saved']} model calls")
+    if args.student:
+        print(
+            f"The student answered {stats['student_answered']} tickets; "
+            f"{stats['routed_fraction']:.1%} were routed to the model"
+        )
+    if args.adaptive:
+        print(f"Skipped the few-shot prompt for {stats['few_shot_skipped']} tickets confirmed by their keywords")
+    if stats['tickets_clipped']:
+        print(f"Clipped {stats['tickets_clipped']} tickets longer than {args.token_budget} tokens")
+    few_shot_tokens = TELEMETRY.snapshot()['few_shot_tokens']
+    if few_shot_tokens['prompts'] and args.workers == 1:
+        print(
+            f"Few-shot prompts averaged {few_shot_tokens['retrieved_mean']:.0f} tokens with retrieved examples, "
+            f"{few_shot_tokens['fixed_mean']:.0f} with the fixed examples"
+        )
+    if args.telemetry_log and args.workers == 1:
+        # Forked workers keep their own timings, so only single-process runs have a summary here
+        TELEMETRY.log("summary", **TELEMETRY.snapshot())
+
+if __name__ == "__main__":
+    main()
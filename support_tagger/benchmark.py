@@ -0,0 +1,270 @@
+"""Offline benchmark of the tagging pipeline on synthetic tickets
+
+A tiny randomly initialised T5 with a locally built word-level tokenizer
+stands in for flan-t5-base, so the benchmark needs no network and finishes in
+seconds. It still runs the real prompts, batching, validation and keyword
+fallback, so changes to those show up in the numbers. Tags from a random model
+are meaningless; only the timings are of interest.
+
+Usage:
+    python -m support_tagger.benchmark --tickets 500 --output bench.json
+    python -m support_tagger.benchmark --tickets 500 --compare bench.json
+"""
+import argparse
+import contextlib
+import functools
+import json
+import platform
+import random
+import re
+import subprocess
+import time
+
+import pandas as pd
+
+from support_tagger import tagging
+from support_tagger.cli import add_tagging_arguments
+from support_tagger.examples import EXAMPLE_MAX_WORDS, ExampleBank
+from support_tagger.keywords import KEYWORDS
+from support_tagger.memory import peak_rss_bytes
+from support_tagger.server import percentile
+from support_tagger.tagging import (
+    ALL_TAGS, DEFAULT_BATCH_SIZE, TAGGING_MODES, TICKET_TOKEN_BUDGET, process_ticket, process_tickets
+)
+from support_tagger.telemetry import TELEMETRY
+
+# Size of the stand-in model; large enough for batching and padding costs to show
+TINY_T5_CONFIG = {"d_model": 64, "d_ff": 128, "d_kv": 16, "num_layers": 2, "num_decoder_layers": 2, "num_heads": 4}
+
+# Clauses appended to seed tickets to reach the sampled length
+FILLER_CLAUSES = [
+    "I already tried restarting the router",
+    "this started after the latest update",
+    "it happens on both my phone and laptop",
+    "the error message says something went wrong",
+    "I was charged twice for the same order",
+    "nobody from support has replied yet",
+    "I need this fixed before tomorrow",
+    "the page just keeps loading",
+    "my colleagues have the same problem",
+    "I cleared the cache and cookies",
+    "the password reset email never arrived",
+    "the app crashes right after the login screen"
+]
+
+def synthetic_corpus(size, seed_texts, mean_words=15, sigma=0.6, seed=0):
+    """Build `size` tickets from seed tickets padded with filler clauses to log-normally distributed lengths"""
+    rng = random.Random(seed)
+    tickets = []
+    for _ in range(size):
+        target = max(3, round(rng.lognormvariate(0, sigma) * mean_words))
+        words = rng.choice(seed_texts).rstrip(".").split()
+        while len(words) < target:
+            words += ["and"] + rng.choice(FILLER_CLAUSES).split()
+        tickets.append(" ".join(words[:target]) + ".")
+    return tickets
+
+def tiny_tagger(texts, seed=0):
+    """Build a text2text-generation pipeline around a random tiny T5 whose vocabulary covers the prompts and `texts`"""
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration, pipeline
+    
+    vocab = {"<pad>": 0, "</s>": 1, "<unk>": 2}
+    corpus = " ".join([tagging.zero_shot_prompt(""), tagging.few_shot_prompt(""), ", ".join(ALL_TAGS), *texts])
+    for token in re.findall(r"\w+|[^\w\s]", corpus.lower()):
+        vocab.setdefault(token, len(vocab))
+    backend = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    backend.normalizer = normalizers.Lowercase()
+    backend.pre_tokenizer = pre_tokenizers.Sequence([pre_tokenizers.WhitespaceSplit(), pre_tokenizers.Punctuation()])
+    backend.post_processor = processors.TemplateProcessing(single="$A </s>", special_tokens=[("</s>", 1)])
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>", eos_token="</s>", unk_token="<unk>")
+    
+    torch.manual_seed(seed)
+    config = T5Config(
+        vocab_size=len(vocab), decoder_start_token_id=0, pad_token_id=0, eos_token_id=1, **TINY_T5_CONFIG
+    )
+    tagger = pipeline("text2text-generation", model=T5ForConditionalGeneration(config).eval(), tokenizer=tokenizer)
+    tagger.model_id = "tiny-t5"
+    tagger.backend = "torch"
+    return TELEMETRY.instrument(tagger)
+
+@contextlib.contextmanager
+def _timed(owner, name, totals):
+    """Temporarily wrap `owner.name` so the time spent in it accumulates in `totals[name]`"""
+    owned = name in vars(owner)
+    original = getattr(owner, name)
+    
+    @functools.wraps(original)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            totals[name] = totals.get(name, 0.0) + time.perf_counter() - start
+    
+    setattr(owner, name, timed)
+    try:
+        yield
+    finally:
+        # A method looked up through the class is restored by removing the instance attribute
+        if owned:
+            setattr(owner, name, original)
+        else:
+            delattr(owner, name)
+
+def run_benchmark(tagger, texts, batch_size=DEFAULT_BATCH_SIZE, mode="generate", latency_sample=50,
+                  token_budget=TICKET_TOKEN_BUDGET, adaptive=False, example_bank=None):
+    """Time batched tagging of `texts` and single-ticket latency on a sample; returns a JSON-ready dict"""
+    # Untimed warmup so one-off initialisation does not land in the first measurement
+    options = {'mode': mode, 'token_budget': token_budget, 'adaptive': adaptive, 'example_bank': example_bank}
+    process_tickets(tagger, texts[:batch_size], batch_size=batch_size, **options)
+    
+    TELEMETRY.reset()
+    fallback = {}
+    with _timed(tagging, "validate_and_fix_tags", fallback), _timed(KEYWORDS, "match_series", fallback):
+        start = time.perf_counter()
+        results = process_tickets(tagger, texts, batch_size=batch_size, **options)
+        batch_seconds = time.perf_counter() - start
+    
+    telemetry = TELEMETRY.snapshot()
+    stages = {stage: round(stats['total_seconds'], 4) for stage, stats in telemetry['stages'].items()}
+    latencies = []
+    for text in texts[:latency_sample]:
+        start = time.perf_counter()
+        process_ticket(tagger, text, **options)
+        latencies.append(time.perf_counter() - start)
+    
+    fallback_seconds = sum(fallback.values())
+    lengths = pd.Series([len(text.split()) for text in texts])
+    return {
+        'corpus': {
+            'tickets': len(texts),
+            'mean_words': round(float(lengths.mean()), 2),
+            'p95_words': int(lengths.quantile(0.95)),
+            'tickets_clipped': sum('clipped_tokens' in result for result in results),
+            'few_shot_skipped': sum(bool(result.get('few_shot_skipped')) for result in results),
+            'prompt_tokens_mean': round(telemetry['prompt_tokens']['mean'], 2)
+        },
+        'throughput': {
+            'seconds': round(batch_seconds, 4),
+            'tickets_per_second': round(len(texts) / batch_seconds, 2) if batch_seconds > 0 else 0.0
+        },
+        'latency_ms': {
+            'tickets': len(latencies),
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3)
+        },
+        'fallback': {
+            'seconds': round(fallback_seconds, 4),
+            'validate_seconds': round(fallback.get("validate_and_fix_tags", 0.0), 4),
+            'keyword_seconds': round(fallback.get("match_series", 0.0), 4),
+            'fraction_of_batch': round(fallback_seconds / batch_seconds, 4) if batch_seconds > 0 else 0.0
+        },
+        'stage_seconds': stages,
+        'peak_rss_mb': round(peak_rss_bytes() / 2**20, 1)
+    }
+
+def _environment():
+    """Versions and commit the numbers were produced with"""
+    import torch
+    import transformers
+    
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'transformers': transformers.__version__
+    }
+
+def _flatten(report, prefix=""):
+    """Numeric leaves of a nested report keyed by dotted path"""
+    flat = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare(baseline, current):
+    """Print every metric next to its baseline value with the relative change"""
+    old, new = _flatten(baseline), _flatten(current)
+    for key in new:
+        if key.startswith("config.") or key not in old:
+            continue
+        change = (new[key] - old[key]) / old[key] if old[key] else 0.0
+        print(f"{key:<32} {old[key]:>12} -> {new[key]:<12} {change:+.1%}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tagging pipeline offline with a tiny random T5")
+    parser.add_argument("--tickets", type=int, default=500, help="Synthetic tickets to generate (default: 500)")
+    parser.add_argument("--mean-words", type=float, default=15, help="Median ticket length in words (default: 15)")
+    parser.add_argument("--length-sigma", type=float, default=0.6,
+                        help="Spread of the log-normal length distribution (default: 0.6)")
+    parser.add_argument("--seed-input", default="tickets.csv", help="CSV whose 'ticket_text' column seeds the corpus")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the corpus and model")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Prompts per generate call")
+    parser.add_argument("--mode", choices=list(TAGGING_MODES), default="generate", help="Tagging mode")
+    parser.add_argument("--latency-sample", type=int, default=50, help="Tickets timed one at a time (default: 50)")
+    add_tagging_arguments(parser, student=False, examples=False)
+    parser.add_argument("--examples-k", type=int, default=None,
+                        help="Show each few-shot prompt this many examples picked by similarity from the fixed ones "
+                             "and the corpus, instead of all fixed examples")
+    parser.add_argument("--no-telemetry", action="store_true", help="Benchmark with per-stage timing turned off")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    parser.add_argument("--compare", default=None, help="Previous JSON report to compare against")
+    args = parser.parse_args(argv)
+    
+    TELEMETRY.enabled = not args.no_telemetry
+    seed_texts = pd.read_csv(args.seed_input)['ticket_text'].astype(str).tolist()
+    texts = synthetic_corpus(args.tickets, seed_texts, mean_words=args.mean_words, sigma=args.length_sigma, seed=args.seed)
+    tagger = tiny_tagger(texts, seed=args.seed)
+    example_bank = None
+    if args.examples_k:
+        # Short corpus tickets, tagged with their keyword matches, grow the bank as tagged tickets would
+        example_bank = ExampleBank(k=args.examples_k)
+        example_bank.add(
+            (text, ", ".join(list(dict.fromkeys(KEYWORDS.match(text) + ALL_TAGS))[:3]))
+            for text in texts if len(text.split()) <= EXAMPLE_MAX_WORDS
+        )
+    
+    report = {
+        'config': {
+            'tickets': args.tickets,
+            'mean_words': args.mean_words,
+            'length_sigma': args.length_sigma,
+            'seed': args.seed,
+            'batch_size': args.batch_size,
+            'mode': args.mode,
+            'token_budget': args.token_budget,
+            'adaptive': args.adaptive,
+            'examples_k': args.examples_k,
+            'telemetry': not args.no_telemetry,
+            'model': TINY_T5_CONFIG
+        },
+        'environment': _environment(),
+        **run_benchmark(
+            tagger, texts, batch_size=args.batch_size, mode=args.mode, latency_sample=args.latency_sample,
+            token_budget=args.token_budget or None, adaptive=args.adaptive, example_bank=example_bank
+        )
+    }
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Persistent SQLite cache of tagging results"""
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# On-disk cache of tagging results, shared by all sessions and kept across restarts
+RESULT_CACHE_PATH = "tagger_cache.sqlite3"
+RESULT_CACHE_MAX_ENTRIES = 50000
+
+class ResultCache:
+    """SQLite-backed LRU cache of tagging results keyed by a hash of the request"""
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    
+    def get_many(self, keys):
+        """Return a {key: value} dict for the keys present in the cache and update hit/miss counters"""
+        keys = list(keys)
+        found = {}
+        with self._lock, self._conn:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM results WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+            now = time.time()
+            self._conn.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            hits = sum(1 for key in keys if key in found)
+            self._increment("hits", hits)
+            self._increment("misses", len(keys) - hits)
+        return found
+    
+    def put_many(self, items):
+        """Store {key: value} pairs, evicting the least recently used entries beyond max_entries"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items.items()]
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self._increment("evictions", excess)
+    
+    def stats(self):
+        """Return persisted hit/miss/eviction counters and the current number of entries"""
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {name: stats.get(name, 0) for name in ("hits", "misses", "evictions", "entries")}
+    
+    def _increment(self, name, amount):
+        if amount:
+            self._conn.execute(
+                "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount)
+            )
+
+def normalize_ticket_text(text):
+    """Normalize ticket text for cache lookups: unicode form, case and whitespace"""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
@@ -0,0 +1,30 @@
+"""Command-line options shared by the tagging commands"""
+from support_tagger.examples import EXAMPLE_BANK_PATH, EXAMPLES_PER_PROMPT
+from support_tagger.student import STUDENT_PATH
+from support_tagger.tagging import TICKET_TOKEN_BUDGET
+
+def add_tagging_arguments(parser, adaptive=True, student=True, examples=True):
+    """Add --token-budget and the --adaptive, --student and --examples options of process_tickets
+    
+    Commands that do not support one of the three turn it off. `--student`
+    and `--examples` take an optional path, so `args.student` and
+    `args.examples` stay None unless given. A `--token-budget` of 0 means no
+    limit, so pass `args.token_budget or None` on.
+    """
+    parser.add_argument("--token-budget", type=int, default=TICKET_TOKEN_BUDGET,
+                        help=f"Most tokens of a ticket sent to the model; longer tickets are clipped "
+                             f"(default: {TICKET_TOKEN_BUDGET}, 0 for no limit)")
+    if student:
+        parser.add_argument("--student", nargs="?", const=STUDENT_PATH, default=None, metavar="PATH",
+                            help=f"Answer confident tickets with the distilled student (default when given: {STUDENT_PATH})")
+        parser.add_argument("--student-confidence", type=float, default=None,
+                            help="Lowest student confidence answered without the model (default: saved with the student)")
+    if adaptive:
+        parser.add_argument("--adaptive", action="store_true",
+                            help="Run few-shot prompts only where the zero-shot tags are not confirmed by keywords")
+    if examples:
+        parser.add_argument("--examples", nargs="?", const=EXAMPLE_BANK_PATH, default=None, metavar="PATH",
+                            help=f"Show each few-shot prompt the most similar examples from this bank "
+                                 f"(default when given: {EXAMPLE_BANK_PATH}, or the fixed examples until it exists)")
+        parser.add_argument("--examples-k", type=int, default=EXAMPLES_PER_PROMPT,
+                            help=f"Examples per few-shot prompt with --examples (default: {EXAMPLES_PER_PROMPT})")
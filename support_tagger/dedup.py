@@ -0,0 +1,90 @@
+"""Near-duplicate grouping of tickets with MinHash LSH, so each group costs one model call"""
+import re
+import zlib
+
+import numpy as np
+
+from support_tagger.cache import normalize_ticket_text
+
+# Default shingle Jaccard similarity at which a ticket reuses another ticket's tags;
+# "website down error 500" and "site is down, 500 error!!" score about 0.68
+NEAR_DUPLICATE_THRESHOLD = 0.65
+
+# MinHash signature length, split into LSH bands of MINHASH_ROWS values each
+MINHASH_PERMUTATIONS = 64
+MINHASH_ROWS = 4
+
+# Mersenne prime for the MinHash permutations; products of two values below it fit in uint64
+_PRIME = (1 << 31) - 1
+
+def shingles(text):
+    """Character trigrams of each word of the normalized text, so word order and punctuation do not matter"""
+    shingle_set = set()
+    for word in re.sub(r"[^\w\s]", "", normalize_ticket_text(text)).split():
+        padded = f" {word} "
+        shingle_set.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return shingle_set
+
+def jaccard(a, b):
+    """Jaccard similarity of two sets, 0.0 when both are empty"""
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+class NearDuplicateGrouper:
+    """Groups near-duplicate tickets so only one representative per group is sent to the model
+    
+    Each ticket joins the first earlier representative whose shingle similarity
+    is at least `threshold`, so every member is close to its representative
+    itself rather than through a chain of neighbours. Candidates come from
+    MinHash LSH buckets and are confirmed with the exact Jaccard similarity, so
+    a batch is grouped without comparing every pair. Counts accumulate across
+    calls and are read with `stats`.
+    """
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD, permutations=MINHASH_PERMUTATIONS, rows=MINHASH_ROWS, seed=0):
+        self.threshold = threshold
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, permutations, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, permutations, dtype=np.uint64)
+        self._tickets = 0
+        self._grouped = 0
+    
+    def _signature(self, shingle_set):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) % _PRIME for shingle in shingle_set),
+            dtype=np.uint64, count=len(shingle_set)
+        )
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+    
+    def group(self, texts):
+        """Return, for each text, the index of its representative; representatives map to themselves"""
+        leaders, shingle_sets, buckets = [], [], {}
+        for i, text in enumerate(texts):
+            current = shingles(text)
+            shingle_sets.append(current)
+            leader = i
+            if current:
+                signature = self._signature(current)
+                bands = [
+                    (band, signature[start:start + self.rows].tobytes())
+                    for band, start in enumerate(range(0, len(signature), self.rows))
+                ]
+                candidates = sorted({j for band in bands for j in buckets.get(band, ())})
+                leader = next((j for j in candidates if jaccard(current, shingle_sets[j]) >= self.threshold), i)
+                if leader == i:
+                    for band in bands:
+                        buckets.setdefault(band, []).append(i)
+            leaders.append(leader)
+        
+        self._tickets += len(texts)
+        self._grouped += sum(leader != i for i, leader in enumerate(leaders))
+        return leaders
+    
+    def stats(self):
+        """Return how many tickets were grouped and how many model calls that saved"""
+        return {
+            'tickets': self._tickets,
+            'representatives': self._tickets - self._grouped,
+            'model_calls_saved': self._grouped,
+            'threshold': self.threshold
+        }
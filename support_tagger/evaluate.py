@@ -0,0 +1,231 @@
+"""Speed and accuracy of tagging strategies on a labeled ticket set
+
+The labeled CSV is `tickets.csv` with a `gold_tags` column of comma-separated
+tags from ALL_TAGS. Each strategy tags every ticket; its zero-shot and
+few-shot tags are scored separately against the gold tags. A strategy is a
+tagging mode, optionally followed by `+adaptive`, `+student` or `+examples`,
+or `keywords` for the keyword fallback of `validate_and_fix_tags` on its own.
+`--student` and `--examples` choose the student and example bank those
+strategies use.
+
+Usage:
+    python -m support_tagger.evaluate tickets_labeled.csv
+    python -m support_tagger.evaluate tickets_labeled.csv --strategies generate score generate+adaptive --min-f1 0.6
+"""
+import argparse
+import json
+import time
+
+import pandas as pd
+
+from support_tagger.cli import add_tagging_arguments
+from support_tagger.examples import EXAMPLE_BANK_PATH, load_example_bank
+from support_tagger.server import percentile
+from support_tagger.student import PROMPT_TYPES, STUDENT_PATH, load_student
+from support_tagger.tagging import (
+    ALL_TAGS, DEFAULT_BATCH_SIZE, MODEL_BACKENDS, MODEL_ID, TAGGING_MODES, TICKET_TOKEN_BUDGET, load_model,
+    process_ticket, process_tickets, validate_and_fix_tags
+)
+
+# Strategies evaluated when none are given
+DEFAULT_STRATEGIES = ("keywords", "generate", "constrained", "score", "generate+adaptive")
+
+# Options a strategy can add to its tagging mode
+STRATEGY_MODIFIERS = ("adaptive", "student", "examples")
+
+def read_labeled(path):
+    """Read a labeled CSV into ticket texts and one gold tag set per ticket"""
+    frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+    missing = {'ticket_text', 'gold_tags'} - set(frame.columns)
+    if missing:
+        raise ValueError(f"{path} needs {', '.join(sorted(missing))} columns")
+    gold = [{tag.strip() for tag in tags.split(",") if tag.strip()} for tags in frame['gold_tags']]
+    unknown = set().union(*gold) - set(ALL_TAGS)
+    if unknown:
+        raise ValueError(f"{path} has gold tags outside ALL_TAGS: {', '.join(sorted(unknown))}")
+    return frame['ticket_text'].tolist(), gold
+
+def parse_strategy(name):
+    """Split a strategy name such as "score+adaptive" into its mode and modifiers"""
+    mode, *modifiers = name.split("+")
+    if mode != "keywords" and mode not in TAGGING_MODES:
+        raise ValueError(f"Unknown mode {mode!r} in strategy {name!r}; expected keywords or one of {', '.join(TAGGING_MODES)}")
+    unknown = set(modifiers) - set(STRATEGY_MODIFIERS)
+    if unknown or (mode == "keywords" and modifiers):
+        raise ValueError(f"Unknown modifiers in strategy {name!r}; modes take {', '.join(STRATEGY_MODIFIERS)}")
+    return mode, set(modifiers)
+
+def score_tags(predicted, gold):
+    """Precision, recall and F1 per tag in ALL_TAGS, micro-averaged, and the share of exact tag set matches"""
+    per_tag = {}
+    totals = [0, 0, 0]
+    for tag in ALL_TAGS:
+        true_positives = sum(tag in p and tag in g for p, g in zip(predicted, gold))
+        false_positives = sum(tag in p and tag not in g for p, g in zip(predicted, gold))
+        false_negatives = sum(tag not in p and tag in g for p, g in zip(predicted, gold))
+        per_tag[tag] = _prf(true_positives, false_positives, false_negatives)
+        per_tag[tag]['support'] = true_positives + false_negatives
+        totals = [total + count for total, count in zip(totals, (true_positives, false_positives, false_negatives))]
+    return {
+        'micro': _prf(*totals),
+        'macro_f1': sum(scores['f1'] for scores in per_tag.values()) / len(ALL_TAGS),
+        'exact_match': sum(p == g for p, g in zip(predicted, gold)) / len(gold) if gold else 0.0,
+        'per_tag': per_tag
+    }
+
+def _prf(true_positives, false_positives, false_negatives):
+    precision = true_positives / (true_positives + false_positives) if true_positives + false_positives else 0.0
+    recall = true_positives / (true_positives + false_negatives) if true_positives + false_negatives else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1}
+
+def _split_tags(tags):
+    return {tag.strip() for tag in tags.split(",") if tag.strip()}
+
+def run_strategy(tagger, name, texts, batch_size=DEFAULT_BATCH_SIZE, latency_sample=20,
+                 token_budget=TICKET_TOKEN_BUDGET, student=None, example_bank=None):
+    """Tag `texts` with one strategy; returns its throughput, latency percentiles and tags per prompt type
+    
+    Results are not cached, so every strategy runs the model on every ticket.
+    Tickets/sec covers both prompts, as a tagging run always produces both.
+    The keyword strategy has a single set of tags, under the prompt type "-".
+    """
+    mode, modifiers = parse_strategy(name)
+    prompt_types = PROMPT_TYPES
+    if mode == "keywords":
+        # No prompt is involved, so there is a single set of tags to score
+        prompt_types = ("-",)
+        tag_one = lambda text: {'-': validate_and_fix_tags("", text)}
+        tag_all = lambda batch: [tag_one(text) for text in batch]
+    else:
+        options = {
+            'mode': mode,
+            'token_budget': token_budget,
+            'adaptive': "adaptive" in modifiers,
+            'student': student if "student" in modifiers else None,
+            'example_bank': example_bank if "examples" in modifiers else None
+        }
+        tag_one = lambda text: process_ticket(tagger, text, **options)
+        tag_all = lambda batch: process_tickets(tagger, batch, batch_size=batch_size, **options)
+    
+    # Untimed warmup so one-off initialisation, such as loading the draft model, is not measured
+    tag_all(texts[:batch_size])
+    start = time.perf_counter()
+    results = tag_all(texts)
+    seconds = time.perf_counter() - start
+    
+    latencies = []
+    for text in texts[:latency_sample]:
+        start_one = time.perf_counter()
+        tag_one(text)
+        latencies.append(time.perf_counter() - start_one)
+    return {
+        'strategy': name,
+        'tickets_per_second': len(texts) / seconds if seconds > 0 else 0.0,
+        'latency_ms': {q: percentile(latencies, q) * 1000 for q in (50, 95, 99)},
+        'tags': {prompt_type: [_split_tags(result[prompt_type]) for result in results] for prompt_type in prompt_types},
+        'student_answered': sum(result.get('tagged_by') == "student" for result in results)
+    }
+
+def pareto_front(rows):
+    """Mark each row that no other row beats on both tickets/sec and micro F1"""
+    for row in rows:
+        row['pareto'] = not any(
+            other['tickets_per_second'] >= row['tickets_per_second'] and other['micro_f1'] >= row['micro_f1']
+            and (other['tickets_per_second'] > row['tickets_per_second'] or other['micro_f1'] > row['micro_f1'])
+            for other in rows
+        )
+    return rows
+
+def evaluate_strategies(tagger, texts, gold, strategies=DEFAULT_STRATEGIES, **options):
+    """Run and score every strategy; returns one row per strategy and prompt type, fastest first"""
+    rows = []
+    for name in strategies:
+        run = run_strategy(tagger, name, texts, **options)
+        for prompt_type, tags in run['tags'].items():
+            scores = score_tags(tags, gold)
+            rows.append({
+                'strategy': name,
+                'prompt': prompt_type,
+                'micro_precision': scores['micro']['precision'],
+                'micro_recall': scores['micro']['recall'],
+                'micro_f1': scores['micro']['f1'],
+                'macro_f1': scores['macro_f1'],
+                'exact_match': scores['exact_match'],
+                'tickets_per_second': run['tickets_per_second'],
+                'latency_p50_ms': run['latency_ms'][50],
+                'latency_p95_ms': run['latency_ms'][95],
+                'latency_p99_ms': run['latency_ms'][99],
+                'student_answered': run['student_answered'],
+                'per_tag': scores['per_tag']
+            })
+    return sorted(pareto_front(rows), key=lambda row: row['tickets_per_second'], reverse=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare tagging strategies on speed and accuracy against gold tags")
+    parser.add_argument("input", help="Labeled CSV with 'ticket_text' and 'gold_tags' columns")
+    parser.add_argument("--strategies", nargs="+", default=list(DEFAULT_STRATEGIES),
+                        help=f"Strategies to run, e.g. keywords, score or generate+adaptive "
+                             f"(default: {' '.join(DEFAULT_STRATEGIES)})")
+    parser.add_argument("--model", default=MODEL_ID, help="Model id or local path")
+    parser.add_argument("--backend", choices=list(MODEL_BACKENDS), default="torch", help="Inference backend")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Prompts per generate call")
+    parser.add_argument("--latency-sample", type=int, default=20, help="Tickets timed one at a time (default: 20)")
+    # --student and --examples pick the files +student and +examples strategies use; they run with the defaults otherwise
+    add_tagging_arguments(parser, adaptive=False)
+    parser.add_argument("--min-f1", type=float, default=None,
+                        help="Also print the fastest strategy whose micro F1 reaches this accuracy bar")
+    parser.add_argument("--output", default=None, help="Write the full report, with per-tag scores, as JSON")
+    args = parser.parse_args(argv)
+    
+    parsed = [parse_strategy(name) for name in args.strategies]
+    texts, gold = read_labeled(args.input)
+    needs_model = any(mode != "keywords" for mode, _ in parsed)
+    tagger = load_model(args.model, backend=args.backend) if needs_model else None
+    uses = set().union(*(modifiers for _, modifiers in parsed))
+    rows = evaluate_strategies(
+        tagger, texts, gold, args.strategies, batch_size=args.batch_size, latency_sample=args.latency_sample,
+        token_budget=args.token_budget or None,
+        student=load_student(args.student or STUDENT_PATH, args.student_confidence) if "student" in uses else None,
+        example_bank=load_example_bank(args.examples or EXAMPLE_BANK_PATH, args.examples_k) if "examples" in uses else None
+    )
+    
+    print(f"{len(texts)} labeled tickets; rows on the speed/accuracy Pareto front are marked *\n")
+    table = pd.DataFrame(rows).drop(columns=['per_tag', 'student_answered'])
+    table['pareto'] = table['pareto'].map({True: "*", False: ""})
+    print(table.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+    
+    print("\nF1 per tag:")
+    per_tag = pd.DataFrame.from_dict({
+        f"{row['strategy']}/{row['prompt']}": {tag: scores['f1'] for tag, scores in row['per_tag'].items()}
+        for row in rows
+    }, orient="index")
+    print(per_tag.to_string(float_format=lambda value: f"{value:.2f}"))
+    
+    if args.min_f1 is not None:
+        passing = [row for row in rows if row['micro_f1'] >= args.min_f1]
+        if passing:
+            best = passing[0]
+            prompt = f" ({best['prompt']} tags)" if best['prompt'] != "-" else ""
+            print(f"\nFastest strategy with micro F1 >= {args.min_f1}: {best['strategy']}{prompt}, "
+                  f"{best['tickets_per_second']:.1f} tickets/s, micro F1 {best['micro_f1']:.3f}")
+        else:
+            print(f"\nNo strategy reaches micro F1 {args.min_f1}")
+    
+    if args.output:
+        report = {
+            'config': {
+                'input': args.input,
+                'tickets': len(texts),
+                'model': args.model,
+                'backend': args.backend,
+                'batch_size': args.batch_size,
+                'token_budget': args.token_budget
+            },
+            'strategies': rows
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Bank of tagged example tickets for picking few-shot examples by similarity
+
+The bank starts from the fixed FEW_SHOT_EXAMPLES and grows from tickets the
+model has already tagged. Examples are indexed with hashed TF-IDF vectors over
+word unigrams and bigrams. When passed to `process_tickets`, each few-shot
+prompt shows only the `k` examples most similar to its ticket instead of all
+of the fixed ones, so prompts are shorter and the examples more relevant.
+
+Usage:
+    python -m support_tagger.examples add tagged_output/jobs/*_tagged.csv --limit 200
+    python -m support_tagger.examples show "The payment page shows error 500"
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from support_tagger.cache import normalize_ticket_text
+from support_tagger.student import PROMPT_TYPES, features, read_tagged
+from support_tagger.tagging import ALL_TAGS, FEW_SHOT_EXAMPLES
+
+# Where the example bank is saved and loaded from by default
+EXAMPLE_BANK_PATH = "example_bank.csv"
+
+# Examples shown per few-shot prompt when they are picked by similarity
+EXAMPLES_PER_PROMPT = 2
+
+# Longest ticket, in words, added to the bank; long examples would cost more prompt tokens than they save
+EXAMPLE_MAX_WORDS = 30
+
+class ExampleBank:
+    """Tagged (ticket, tags) examples with a hashed TF-IDF index for nearest-neighbour lookup"""
+    def __init__(self, examples=FEW_SHOT_EXAMPLES, k=EXAMPLES_PER_PROMPT):
+        self.examples = []
+        self.k = k
+        self._seen = set()
+        self._index = None
+        self._fingerprint = None
+        self.add(examples)
+    
+    def __len__(self):
+        return len(self.examples)
+    
+    def add(self, examples):
+        """Add (ticket, tags) pairs, skipping tickets already in the bank; returns how many were added"""
+        added = 0
+        for ticket, tags in examples:
+            key = normalize_ticket_text(ticket)
+            if key not in self._seen:
+                self._seen.add(key)
+                self.examples.append((ticket, tags))
+                added += 1
+        if added:
+            self._index = None
+            self._fingerprint = None
+        return added
+    
+    def _build(self):
+        """Index the examples as L2-normalised TF-IDF rows, stored as postings sorted by feature"""
+        # Feature 0 is the bias every text has, which carries no similarity
+        rows = [features(ticket)[1:] for ticket, _ in self.examples]
+        indices = np.concatenate(rows)
+        owners = np.repeat(np.arange(len(rows)), [len(row) for row in rows])
+        document_frequency = np.bincount(indices)
+        idf = np.log((1 + len(rows)) / (1 + document_frequency)) + 1
+        weights = idf[indices]
+        norms = np.sqrt(np.bincount(owners, weights=weights ** 2, minlength=len(rows)))
+        weights = weights / norms[owners]
+        order = np.argsort(indices, kind="stable")
+        self._index = (indices[order], owners[order], weights[order], idf)
+    
+    def select(self, texts):
+        """Return the `k` examples most similar to each text, least similar first so the closest sits next to the ticket
+        
+        Ties, including texts sharing no words with any example, go to the
+        examples added first, so the fixed examples are the fallback.
+        """
+        if not self.examples:
+            return [[] for _ in texts]
+        if self._index is None:
+            self._build()
+        indices, owners, weights, idf = self._index
+        k = min(self.k, len(self.examples))
+        chosen = []
+        for text in texts:
+            query = features(text)[1:]
+            query = query[query < len(idf)]
+            query_weights = idf[query] / (np.sqrt((idf[query] ** 2).sum()) or 1.0)
+            starts = np.searchsorted(indices, query, side="left")
+            lengths = np.searchsorted(indices, query, side="right") - starts
+            # Positions of every posting of every query feature, gathered in one pass
+            postings = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            scores = np.bincount(
+                owners[postings], weights=weights[postings] * np.repeat(query_weights, lengths),
+                minlength=len(self.examples)
+            )
+            best = np.argsort(-scores, kind="stable")[:k]
+            chosen.append([self.examples[i] for i in best[::-1]])
+        return chosen
+    
+    def fingerprint(self):
+        """Hash of the examples and `k`, for cache keys: results depend on which examples a prompt can show"""
+        if self._fingerprint is None:
+            payload = json.dumps({'examples': self.examples, 'k': self.k})
+            self._fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        return self._fingerprint
+    
+    def save(self, path=EXAMPLE_BANK_PATH):
+        """Write the examples to a CSV with 'ticket_text' and 'tags' columns"""
+        pd.DataFrame(self.examples, columns=['ticket_text', 'tags']).to_csv(path, index=False)
+    
+    @classmethod
+    def load(cls, path=EXAMPLE_BANK_PATH, k=EXAMPLES_PER_PROMPT):
+        """Read a bank written by `save`"""
+        frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+        return cls(zip(frame['ticket_text'], frame['tags']), k=k)
+
+_banks = {}
+
+def load_example_bank(path=EXAMPLE_BANK_PATH, k=None):
+    """Return the bank saved at `path`, or one holding only FEW_SHOT_EXAMPLES when there is no file yet
+    
+    A `k` overrides EXAMPLES_PER_PROMPT. Banks are kept per path and `k`, and
+    rebuilt only when the file changes, so callers asking for the same bank
+    get the same instance and the micro-batcher can put their tickets in one
+    call.
+    """
+    k = k or EXAMPLES_PER_PROMPT
+    stamp = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _banks.get((path, k))
+    if cached is None or cached[0] != stamp:
+        bank = ExampleBank.load(path, k=k) if stamp is not None else ExampleBank(k=k)
+        cached = _banks[(path, k)] = (stamp, bank)
+    return cached[1]
+
+def tagged_examples(frame, max_words=EXAMPLE_MAX_WORDS):
+    """(ticket, tags) pairs from tagged rows whose zero-shot and few-shot tags agree, shortest tickets first
+    
+    Agreement between the two prompts is the best available sign that the
+    tags are right, and short tickets make cheap examples. Rows whose
+    few-shot prompt was skipped only repeat the zero-shot tags, so they are
+    left out.
+    """
+    if 'few_shot_skipped' in frame.columns:
+        frame = frame[frame['few_shot_skipped'].astype(str) != "True"]
+    pairs = []
+    for ticket, zero_shot, few_shot in frame[['ticket_text', *PROMPT_TYPES]].itertuples(index=False):
+        tags = [tag.strip() for tag in str(zero_shot).split(",")]
+        agreed = set(tags) == {tag.strip() for tag in str(few_shot).split(",")}
+        if agreed and len(set(tags)) == 3 and set(tags) <= set(ALL_TAGS) and len(str(ticket).split()) <= max_words:
+            pairs.append((str(ticket), ", ".join(tags)))
+    return sorted(pairs, key=lambda pair: len(pair[0].split()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grow or inspect the few-shot example bank")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add tickets from tagged CSV or Parquet files to the bank")
+    add.add_argument("inputs", nargs="*", help="Tagged files (default: every CSV job output under tagged_output/jobs)")
+    add.add_argument("--bank", default=EXAMPLE_BANK_PATH, help=f"Example bank file (default: {EXAMPLE_BANK_PATH})")
+    add.add_argument("--limit", type=int, default=200, help="Most examples to add (default: 200)")
+    add.add_argument("--max-words", type=int, default=EXAMPLE_MAX_WORDS,
+                     help=f"Longest ticket added, in words (default: {EXAMPLE_MAX_WORDS})")
+    show = commands.add_parser("show", help="Print the examples a ticket's few-shot prompt would show")
+    show.add_argument("text", help="Ticket text")
+    show.add_argument("--bank", default=EXAMPLE_BANK_PATH, help=f"Example bank file (default: {EXAMPLE_BANK_PATH})")
+    show.add_argument("-k", type=int, default=EXAMPLES_PER_PROMPT,
+                      help=f"Examples per prompt (default: {EXAMPLES_PER_PROMPT})")
+    args = parser.parse_args(argv)
+    
+    if args.command == "show":
+        bank = load_example_bank(args.bank, args.k)
+        for ticket, tags in bank.select([args.text])[0]:
+            print(f"{tags:<40} {ticket}")
+        return
+    
+    bank = load_example_bank(args.bank)
+    frame = read_tagged(args.inputs or sorted(glob.glob(os.path.join("tagged_output", "jobs", "*_tagged.csv"))))
+    added = bank.add(tagged_examples(frame, args.max_words)[:args.limit])
+    bank.save(args.bank)
+    print(f"Added {added} examples; {args.bank} now holds {len(bank)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Background queue of CSV tagging jobs with persisted status and progress"""
+import contextlib
+import functools
+import io
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from support_tagger.dedup import NearDuplicateGrouper
+from support_tagger.examples import load_example_bank
+from support_tagger.streaming import DEFAULT_CHUNK_SIZE, stream_tickets
+from support_tagger.student import load_student
+from support_tagger.tagging import DEFAULT_BATCH_SIZE, MODEL_ID, TICKET_TOKEN_BUDGET, process_tickets
+
+# Where uploaded files, job outputs and the job database are kept
+JOBS_DIR = os.path.join("tagged_output", "jobs")
+
+# Job states, in the order a job moves through them
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+class JobQueue:
+    """Runs CSV tagging jobs one at a time on a background thread
+    
+    Each job's input is saved under `jobs_dir` and tagged with `stream_tickets`,
+    so output and checkpoints land on disk as the job runs. Job status and
+    progress are stored in SQLite; jobs that were queued or running when the
+    process stopped are picked up again, resuming from their checkpoint.
+    """
+    def __init__(self, jobs_dir=JOBS_DIR, cache=None):
+        self.jobs_dir = jobs_dir
+        self.cache = cache
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(jobs_dir, "jobs.sqlite3"), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, name TEXT NOT NULL, status TEXT NOT NULL, options TEXT NOT NULL, "
+                "input_path TEXT NOT NULL, output_path TEXT NOT NULL, rows_done INTEGER NOT NULL DEFAULT 0, "
+                "progress REAL NOT NULL DEFAULT 0, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            # Added after the first release; older job databases gain the columns here
+            for column in ("stats TEXT", "started REAL", "start_progress REAL"):
+                try:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+                except sqlite3.OperationalError:
+                    pass
+        self._tagger = None
+        self._pool = None
+        self._tagger_ready = threading.Event()
+        self._pending = queue.Queue()
+        for job in self.list_jobs():
+            if job['status'] in (QUEUED, RUNNING):
+                self._pending.put(job['id'])
+        self._thread = threading.Thread(target=self._run, name="tagging-jobs", daemon=True)
+        self._thread.start()
+    
+    def attach(self, tagger):
+        """Give the worker the pipeline to use; jobs wait until one is attached"""
+        self._tagger = tagger
+        self._tagger_ready.set()
+    
+    def attach_pool(self, pool):
+        """Run each job on its own model from a ModelPool instead of one attached pipeline"""
+        self._pool = pool
+        self._tagger_ready.set()
+    
+    def submit(self, name, data, batch_size=DEFAULT_BATCH_SIZE, mode="generate", chunk_size=DEFAULT_CHUNK_SIZE,
+               output_format="csv", near_duplicate_threshold=None, token_budget=TICKET_TOKEN_BUDGET, student_path=None,
+               student_confidence=None, adaptive=False, example_bank_path=None, examples_k=None, model_id=None,
+               backend=None):
+        """Save an uploaded CSV and queue it for tagging; returns the job id
+        
+        With a `near_duplicate_threshold`, near-duplicate tickets within each
+        chunk share one model call. `token_budget` and `adaptive` are passed to
+        process_tickets, along with the student loaded from `student_path` at
+        `student_confidence` and the bank loaded from `example_bank_path` with
+        `examples_k` examples per prompt. With a model pool attached, the job runs on `model_id`
+        (MODEL_ID by default) loaded with `backend` (the pool's by default),
+        which stays pinned in the pool while it runs.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        input_path = os.path.join(self.jobs_dir, f"{job_id}.csv")
+        output_path = os.path.join(self.jobs_dir, f"{job_id}_tagged.{output_format}")
+        with open(input_path, "wb") as f:
+            f.write(data)
+        options = {
+            'batch_size': batch_size,
+            'mode': mode,
+            'chunk_size': chunk_size,
+            'output_format': output_format,
+            'near_duplicate_threshold': near_duplicate_threshold,
+            'token_budget': token_budget,
+            'student_path': student_path,
+            'student_confidence': student_confidence,
+            'adaptive': adaptive,
+            'example_bank_path': example_bank_path,
+            'examples_k': examples_k,
+            'model_id': model_id,
+            'backend': backend
+        }
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, name, status, options, input_path, output_path, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, name, QUEUED, json.dumps(options), input_path, output_path, now, now)
+            )
+        self._pending.put(job_id)
+        return job_id
+    
+    def get_job(self, job_id):
+        """Return one job as a dict, or None if it does not exist"""
+        jobs = self._select("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+    
+    def list_jobs(self, limit=None):
+        """Return jobs, newest first"""
+        return self._select("ORDER BY created DESC" + (f" LIMIT {int(limit)}" if limit else ""), ())
+    
+    def _select(self, clause, params):
+        with self._lock:
+            cursor = self._conn.execute(f"SELECT * FROM jobs {clause}", params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        jobs = [dict(zip(columns, row)) for row in rows]
+        for job in jobs:
+            job['options'] = json.loads(job['options'])
+            job['stats'] = json.loads(job['stats']) if job.get('stats') else {}
+        return jobs
+    
+    def _update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                (*fields.values(), job_id)
+            )
+    
+    def _run(self):
+        while True:
+            job = self.get_job(self._pending.get())
+            if job is None or job['status'] not in (QUEUED, RUNNING):
+                continue
+            self._tagger_ready.wait()
+            self._update(job['id'], status=RUNNING, error=None, started=time.time(), start_progress=job['progress'])
+            
+            options = job['options']
+            threshold = options.get('near_duplicate_threshold')
+            near_duplicates = NearDuplicateGrouper(threshold) if threshold else None
+            tickets_clipped = tickets_seen = student_answered = few_shot_skipped = 0
+            
+            def tag_chunk(texts, progress):
+                nonlocal tickets_clipped, tickets_seen, student_answered, few_shot_skipped
+                results = tag_tickets(texts, progress_callback=progress)
+                tickets_clipped += sum('clipped_tokens' in result for result in results)
+                tickets_seen += len(results)
+                student_answered += sum(result.get('tagged_by') == "student" for result in results)
+                few_shot_skipped += sum(bool(result.get('few_shot_skipped')) for result in results)
+                return results
+            
+            def job_stats():
+                # Counts cover this run only; rows tagged before a restart are not regrouped or recounted
+                stats = {**(near_duplicates.stats() if near_duplicates else {}), 'tickets_clipped': tickets_clipped}
+                if options.get('student_path'):
+                    stats['student_answered'] = student_answered
+                    stats['routed_fraction'] = 1 - student_answered / tickets_seen if tickets_seen else 0.0
+                if options.get('adaptive'):
+                    stats['few_shot_skipped'] = few_shot_skipped
+                return json.dumps(stats)
+            
+            try:
+                pool = self._pool
+                model = (
+                    pool.using(options.get('model_id') or MODEL_ID, backend=options.get('backend')) if pool
+                    else contextlib.nullcontext(self._tagger)
+                )
+                student_path = options.get('student_path')
+                student = load_student(student_path, options.get('student_confidence')) if student_path else None
+                example_bank_path = options.get('example_bank_path')
+                example_bank = load_example_bank(example_bank_path, options.get('examples_k')) if example_bank_path else None
+                with model as tagger, open(job['input_path'], "rb") as source:
+                    tag_tickets = functools.partial(
+                        process_tickets, tagger, batch_size=options['batch_size'], mode=options['mode'],
+                        cache=self.cache, near_duplicates=near_duplicates,
+                        token_budget=options.get('token_budget', TICKET_TOKEN_BUDGET), student=student,
+                        adaptive=options.get('adaptive', False), example_bank=example_bank
+                    )
+                    rows_done, _, _ = stream_tickets(
+                        source,
+                        job['output_path'],
+                        tag_chunk,
+                        output_format=options['output_format'],
+                        chunk_size=options['chunk_size'],
+                        progress_callback=lambda rows, fraction: self._update(
+                            job['id'], rows_done=rows, progress=fraction, stats=job_stats()
+                        )
+                    )
+            except Exception as e:
+                self._update(job['id'], status=FAILED, error=str(e))
+            else:
+                self._update(job['id'], status=DONE, rows_done=rows_done, progress=1.0, stats=job_stats())
+
+def job_eta(job):
+    """Estimated seconds until a running job finishes, from its progress since it last started, or None"""
+    done = job['progress'] - (job.get('start_progress') or 0.0)
+    if job['status'] != RUNNING or not job.get('started') or done <= 0:
+        return None
+    return (time.time() - job['started']) * (1 - job['progress']) / done
+
+def read_job_preview(job, rows=10):
+    """Return the last `rows` tagged rows written so far by a job, or an empty frame"""
+    path = job['output_path']
+    if job['options']['output_format'] == "parquet":
+        parts = sorted(os.listdir(path)) if os.path.isdir(path) else []
+        return pd.read_parquet(os.path.join(path, parts[-1])).tail(rows) if parts else pd.DataFrame()
+    
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame()
+    # Read only the header and the end of the file so previews stay cheap for large outputs
+    with open(path, "rb") as f:
+        header = f.readline()
+        start = max(f.tell(), os.path.getsize(path) - 64 * 1024)
+        f.seek(start)
+        tail = f.read()
+    if start > len(header):
+        # Drop the partial line where the tail begins
+        tail = tail.split(b"\n", 1)[1] if b"\n" in tail else b""
+    try:
+        frame = pd.read_csv(io.BytesIO(header + tail))
+    except (pd.errors.ParserError, pd.errors.EmptyDataError):
+        return pd.DataFrame()
+    return frame.tail(rows)
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue(jobs_dir=JOBS_DIR, cache=None):
+    """Return the process-wide job queue, creating it on first use
+    
+    The queue is kept at module level rather than in Streamlit's resource cache
+    so that clearing that cache does not stop running jobs.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(jobs_dir, cache=cache)
+        return _job_queue
@@ -0,0 +1,53 @@
+"""Benchmark the compiled keyword matcher against the original substring loop
+
+Usage:
+    python -m support_tagger.keyword_benchmark --repeat 10000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from support_tagger.keywords import KEYWORD_MAPPINGS, KEYWORDS
+
+def _substring_keyword_tags(text, mappings=KEYWORD_MAPPINGS):
+    """The original per-ticket substring scan, kept as the benchmark baseline"""
+    text_lower = text.lower()
+    return [tag for tag, keywords in mappings.items() if any(keyword in text_lower for keyword in keywords)]
+
+def benchmark(texts):
+    """Time the substring loop, the compiled matcher per text and the Series matcher over the same texts"""
+    series = pd.Series(texts)
+    timings = {}
+    
+    start = time.perf_counter()
+    baseline = [_substring_keyword_tags(text) for text in texts]
+    timings['substring_loop'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    compiled = [KEYWORDS.match(text) for text in texts]
+    timings['compiled_per_text'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    vectorized = KEYWORDS.match_series(series)
+    timings['compiled_series'] = time.perf_counter() - start
+    
+    assert compiled == vectorized.tolist()
+    changed = sum(1 for old, new in zip(baseline, compiled) if old != new)
+    return timings, changed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the keyword matcher against the original substring loop")
+    parser.add_argument("--input", default="tickets.csv", help="CSV with a 'ticket_text' column")
+    parser.add_argument("--repeat", type=int, default=10000, help="Times to repeat the input texts")
+    args = parser.parse_args(argv)
+    
+    texts = pd.read_csv(args.input)['ticket_text'].astype(str).tolist() * args.repeat
+    timings, changed = benchmark(texts)
+    for name, seconds in timings.items():
+        speedup = timings['substring_loop'] / seconds if seconds > 0 else float("inf")
+        print(f"{name:<20} {seconds * 1000:10.1f} ms  {len(texts) / seconds:12.0f} texts/sec  x{speedup:.1f}")
+    print(f"{changed} of {len(texts)} texts matched different tags than the substring loop (word boundaries)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Compiled keyword matcher used to fill in tags the model did not return"""
+import re
+
+# Keywords that suggest each tag, in tag priority order
+KEYWORD_MAPPINGS = {
+    "internet": ["internet", "connection", "wifi", "network"],
+    "account": ["account", "profile", "user"],
+    "payment": ["payment", "billing", "charge", "transaction"],
+    "technical": ["technical", "issue", "problem", "not working"],
+    "login": ["login", "log in", "sign in", "access"],
+    "error": ["error", "crash", "failed", "issue"],
+    "server": ["server", "500", "down"],
+    "website": ["website", "site", "page"],
+    "reset": ["reset", "password", "recover"],
+    "password": ["password", "pass"],
+    "connectivity": ["connectivity", "connection", "internet"],
+    "crash": ["crash", "crashes", "crashing"]
+}
+
+# Inflected forms that match as well as each keyword itself. Forms are listed per
+# keyword rather than derived from a blanket suffix list, so "errors" and
+# "recovery" match while "passed", "passing" and "username" do not
+KEYWORD_FORMS = {
+    "connection": ["connections"],
+    "network": ["networks"],
+    "account": ["accounts"],
+    "profile": ["profiles"],
+    "user": ["users"],
+    "payment": ["payments"],
+    "charge": ["charges", "charged", "charging"],
+    "transaction": ["transactions"],
+    "issue": ["issues"],
+    "problem": ["problems"],
+    "login": ["logins"],
+    "log in": ["logged in", "logging in"],
+    "sign in": ["signed in", "signing in"],
+    "access": ["accessed", "accessing"],
+    "error": ["errors"],
+    "crash": ["crashes", "crashed", "crashing"],
+    "server": ["servers"],
+    "website": ["websites"],
+    "site": ["sites"],
+    "page": ["pages"],
+    "reset": ["resets", "resetting"],
+    "password": ["passwords"],
+    "recover": ["recovers", "recovered", "recovering", "recovery"]
+}
+
+def _trie_regex(words):
+    """Build a regex alternation factored by common prefixes, which Python's re scans far faster than a flat one"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word ending here makes the rest optional; the regex stays greedy so longer forms win
+        return f"(?:{body})?" if "" in node else body
+    
+    return build(trie)
+
+class KeywordMatcher:
+    """Matches whole-word keywords for every tag with a single compiled, prefix-factored regex"""
+    def __init__(self, mappings=KEYWORD_MAPPINGS, forms=KEYWORD_FORMS):
+        self.tag_order = list(mappings)
+        # Every accepted surface form maps to the union of tags of the keywords it inflects
+        self._form_tags = {}
+        for tag, keywords in mappings.items():
+            for keyword in keywords:
+                for form in [keyword, *forms.get(keyword, ())]:
+                    self._form_tags.setdefault(form, set()).add(tag)
+        self.pattern = re.compile(r"\b(?:" + _trie_regex(self._form_tags) + r")\b")
+        self._tags_for_forms = {}
+    
+    def _tags(self, forms):
+        """Return the tags for a set of matched forms, in tag priority order"""
+        key = frozenset(forms)
+        tags = self._tags_for_forms.get(key)
+        if tags is None:
+            matched = set().union(*(self._form_tags[form] for form in key))
+            tags = self._tags_for_forms[key] = [tag for tag in self.tag_order if tag in matched]
+        return tags
+    
+    def match(self, text):
+        """Return the tags whose keywords appear in `text`, in tag priority order"""
+        return self._tags(self.pattern.findall(text.lower()))
+    
+    def match_series(self, texts):
+        """Return a Series holding the matched tag list for every text in a Series"""
+        return texts.astype(str).map(self.match)
+
+# Shared matcher compiled once at import
+KEYWORDS = KeywordMatcher()
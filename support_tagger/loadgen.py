@@ -0,0 +1,64 @@
+"""Load generator for the tagging server
+
+Usage:
+    python -m support_tagger.loadgen --url http://127.0.0.1:8000 --requests 500 --concurrency 32
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from support_tagger.server import percentile
+
+def _post(url, text, timeout):
+    """Send one ticket and return its round-trip latency in seconds"""
+    request = urllib.request.Request(
+        f"{url}/tag", data=json.dumps({'text': text}).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - start
+
+def run_load(url, texts, requests, concurrency, timeout=300):
+    """Send `requests` tickets from `concurrency` threads and return client-side statistics"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_post, url, texts[i % len(texts)], timeout) for i in range(requests)]
+    elapsed = time.perf_counter() - start
+    
+    latencies, errors = [], 0
+    for future in futures:
+        if future.exception() is None:
+            latencies.append(future.result())
+        else:
+            errors += 1
+    return {
+        'requests': requests,
+        'errors': errors,
+        'concurrency': concurrency,
+        'requests_per_second': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send concurrent tagging requests to the tagging server")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server base URL")
+    parser.add_argument("--input", default="tickets.csv", help="CSV with a 'ticket_text' column to sample from")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    args = parser.parse_args(argv)
+    
+    texts = pd.read_csv(args.input)['ticket_text'].astype(str).tolist()
+    client = run_load(args.url, texts, args.requests, args.concurrency)
+    with urllib.request.urlopen(f"{args.url}/metrics") as response:
+        server = json.loads(response.read())
+    
+    print(json.dumps({'client': client, 'server': server}, indent=2))
+
+if __name__ == "__main__":
+    main()
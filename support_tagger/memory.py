@@ -0,0 +1,24 @@
+"""Resident memory readings for the current process"""
+import os
+import sys
+
+def rss_bytes():
+    """Current resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        # Without /proc or psutil the peak is the closest reading available
+        return peak_rss_bytes()
+    return psutil.Process().memory_info().rss
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes"""
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return usage if sys.platform == "darwin" else usage * 1024
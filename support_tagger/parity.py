@@ -0,0 +1,109 @@
+"""Compare inference backends against the fp32 PyTorch baseline
+
+Each backend is loaded and run in its own fresh process, so the reported
+resident memory belongs to that backend alone.
+
+Usage:
+    python -m support_tagger.parity --input tickets.csv --backends torch int8 onnx
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from support_tagger.memory import rss_bytes
+from support_tagger.tagging import (
+    DEFAULT_BATCH_SIZE, MODEL_BACKENDS, MODEL_ID, TAGGING_MODES, load_model, process_tickets
+)
+
+def _run_backend(backend, model_id, texts, batch_size, mode):
+    """Load one backend, tag `texts` and return its tags, timings and memory use"""
+    rss_start = rss_bytes()
+    load_start = time.perf_counter()
+    tagger = load_model(model_id, backend=backend)
+    load_time = time.perf_counter() - load_start
+    rss_loaded = rss_bytes()
+    
+    # One untimed ticket so lazy initialisation does not count against throughput
+    process_tickets(tagger, texts[:1], batch_size=batch_size, mode=mode)
+    tag_start = time.perf_counter()
+    results = process_tickets(tagger, texts, batch_size=batch_size, mode=mode)
+    tag_time = time.perf_counter() - tag_start
+    
+    return {
+        'backend': backend,
+        'load_seconds': load_time,
+        'tag_seconds': tag_time,
+        'tickets_per_second': len(texts) / tag_time if tag_time > 0 else 0.0,
+        'model_rss_mb': (rss_loaded - rss_start) / 2**20,
+        'rss_mb': rss_bytes() / 2**20,
+        'tags': [(result['zero_shot'], result['few_shot']) for result in results]
+    }
+
+def _tag_set(tags):
+    """The set of tags in a comma-separated tag string"""
+    return {tag.strip() for tag in tags.split(",") if tag.strip()}
+
+def _agreement(reference, candidate):
+    """Fraction of tickets whose tag sets match the reference, per prompt type and for both"""
+    pairs = [
+        ((_tag_set(ref[0]), _tag_set(ref[1])), (_tag_set(cand[0]), _tag_set(cand[1])))
+        for ref, cand in zip(reference, candidate)
+    ]
+    zero_shot = sum(ref[0] == cand[0] for ref, cand in pairs)
+    few_shot = sum(ref[1] == cand[1] for ref, cand in pairs)
+    both = sum(ref == cand for ref, cand in pairs)
+    total = max(1, len(pairs))
+    return {'zero_shot': zero_shot / total, 'few_shot': few_shot / total, 'both': both / total}
+
+def compare_backends(texts, backends=tuple(MODEL_BACKENDS), model_id=MODEL_ID, batch_size=DEFAULT_BATCH_SIZE,
+                     mode="generate"):
+    """Run every backend over `texts` and report agreement, speed and RSS relative to fp32 PyTorch"""
+    backends = ["torch"] + [backend for backend in backends if backend != "torch"]
+    runs = {}
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                runs[backend] = pool.submit(_run_backend, backend, model_id, texts, batch_size, mode).result()
+            except ImportError as e:
+                runs[backend] = {'backend': backend, 'error': str(e)}
+    
+    baseline = runs["torch"]
+    report = []
+    for backend in backends:
+        run = runs[backend]
+        if 'error' in run:
+            report.append({'backend': backend, 'error': run['error']})
+            continue
+        report.append({
+            'backend': backend,
+            'agreement': _agreement(baseline['tags'], run['tags']),
+            'tickets_per_second': run['tickets_per_second'],
+            'speedup': run['tickets_per_second'] / baseline['tickets_per_second'] if baseline['tickets_per_second'] else 0.0,
+            'load_seconds': run['load_seconds'],
+            'model_rss_mb': run['model_rss_mb'],
+            'rss_mb': run['rss_mb'],
+            'rss_delta_mb': run['rss_mb'] - baseline['rss_mb']
+        })
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check tag agreement, speed and memory of inference backends against fp32")
+    parser.add_argument("--input", default="tickets.csv", help="CSV with a 'ticket_text' column")
+    parser.add_argument("--limit", type=int, default=100, help="Tickets to compare (default: 100)")
+    parser.add_argument("--backends", nargs="+", choices=list(MODEL_BACKENDS), default=list(MODEL_BACKENDS),
+                        help="Backends to compare; fp32 'torch' is always included as the baseline")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Prompts per generate call")
+    parser.add_argument("--mode", choices=list(TAGGING_MODES), default="generate", help="Tagging mode")
+    parser.add_argument("--model", default=MODEL_ID, help="Model id or local path")
+    args = parser.parse_args(argv)
+    
+    texts = pd.read_csv(args.input)['ticket_text'].astype(str).head(args.limit).tolist()
+    report = compare_backends(texts, args.backends, model_id=args.model, batch_size=args.batch_size, mode=args.mode)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Memory-bounded pool of loaded models with least-recently-used eviction
+
+Several text2text-generation pipelines, e.g. flan-t5-small, base and large,
+stay loaded side by side as long as they fit in a RAM budget, so switching
+between them does not reload from scratch. When a load takes the pool over
+budget, the least recently used models that are not pinned are dropped. Each
+holder's active model, such as a browser session's, and models a job is using
+are pinned, and the next model can be loaded in the background before it is
+needed. A model loaded with another
+inference backend is a separate entry under the same budget.
+
+Usage:
+    python -m support_tagger.pool google/flan-t5-small google/flan-t5-base --budget-mb 2048
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from support_tagger.memory import rss_bytes
+from support_tagger.startup import ModelLoader
+from support_tagger.tagging import MODEL_BACKENDS, process_ticket
+
+# Models the pool is meant to switch between, smallest first
+POOL_MODEL_IDS = ("google/flan-t5-small", "google/flan-t5-base", "google/flan-t5-large")
+
+# RAM the pool's models may take together before the least recently used one is evicted; set
+# SUPPORT_TAGGER_POOL_BUDGET_MB to change it for the whole process
+MODEL_POOL_BUDGET_BYTES = int(float(os.environ.get("SUPPORT_TAGGER_POOL_BUDGET_MB", 4096)) * 1024 ** 2)
+
+def _tensor_bytes(value, seen):
+    if isinstance(value, (tuple, list)):
+        # Quantized linear layers keep their weight and bias as a tuple
+        return sum(_tensor_bytes(item, seen) for item in value)
+    if not hasattr(value, "element_size"):
+        return 0
+    # Tied weights, such as T5's shared embeddings, appear under several names but are stored once
+    pointer = value.data_ptr()
+    if pointer in seen:
+        return 0
+    seen.add(pointer)
+    return value.numel() * value.element_size()
+
+def weight_bytes(model):
+    """Bytes taken by a torch model's parameters and buffers, or None for models that are not torch modules"""
+    if not callable(getattr(model, "state_dict", None)):
+        return None
+    seen = set()
+    return sum(_tensor_bytes(value, seen) for value in model.state_dict().values())
+
+def _checked_backend(backend):
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {', '.join(MODEL_BACKENDS)}")
+    return backend
+
+class _Entry:
+    """A model in the pool: its loader, pin count and resident size"""
+    def __init__(self):
+        self.loader = None
+        self.pins = 0
+        self.resident_bytes = None
+        self.rss_before = rss_bytes()
+        self.last_used = time.time()
+
+class ModelPool:
+    """Keeps several loaded pipelines within a RAM budget, evicting the least recently used unpinned one
+    
+    Models load on background threads through ModelLoader. A model's resident
+    size is the size of its weights and buffers, or, for backends that are not
+    torch modules, how much this process's RSS grew while it loaded. Sizes are
+    remembered after eviction, so reloading a model makes room for it before
+    the load starts. The most recently used model is never evicted, so a model
+    larger than the budget still loads, alone. Every method takes an optional
+    `backend`; without one, models load with the pool's `backend`.
+    """
+    def __init__(self, budget_bytes=MODEL_POOL_BUDGET_BYTES, backend="torch", warmup=True):
+        self.budget_bytes = budget_bytes
+        self.backend = _checked_backend(backend)
+        self.warmup = warmup
+        # (model_id, backend) of each holder's active model
+        self._active = {}
+        self.evictions = 0
+        self._lock = threading.RLock()
+        # Keyed by (model_id, backend), least recently used first
+        self._entries = OrderedDict()
+        self._sizes = {}
+    
+    def _key(self, model_id, backend):
+        return model_id, _checked_backend(backend or self.backend)
+    
+    def loader(self, model_id, backend=None):
+        """Return the ModelLoader for a model, starting its load if it is not in the pool, and mark it used"""
+        key = self._key(model_id, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.loader.error is not None:
+                self._entries.pop(key, None)
+                self._make_room(self._sizes.get(key, 0))
+                entry = self._entries[key] = _Entry()
+                # The loader thread reports back through _loaded, which waits for this lock
+                entry.loader = ModelLoader(
+                    model_id, backend=key[1], warmup=self.warmup,
+                    on_loaded=lambda tagger: self._loaded(key, entry, tagger)
+                )
+            entry.last_used = time.time()
+            self._entries.move_to_end(key)
+            return entry.loader
+    
+    def get(self, model_id, timeout=None, backend=None):
+        """Return a model's pipeline, loading it first if needed"""
+        return self.loader(model_id, backend).wait(timeout)
+    
+    def preload(self, model_id, backend=None):
+        """Start loading a model in the background without waiting for it"""
+        self.loader(model_id, backend)
+    
+    def activate(self, model_id, preload=None, backend=None, holder=None):
+        """Make `model_id` the active model of `holder`, pinning it, and optionally preload the next one
+        
+        The holder's previously active model, including the same model on
+        another backend, is unpinned; other holders' models stay pinned.
+        Returns the active model's ModelLoader.
+        """
+        key = self._key(model_id, backend)
+        with self._lock:
+            previous = self._active.get(holder)
+            if previous != key:
+                self.pin(*key)
+                self._active[holder] = key
+                if previous is not None:
+                    self.unpin(*previous)
+            loader = self.loader(*key)
+            if preload and preload != model_id:
+                self.preload(preload, backend)
+            self._make_room(0)
+            return loader
+    
+    def holders(self):
+        """The holders with an active model"""
+        with self._lock:
+            return list(self._active)
+    
+    def release(self, holder):
+        """Unpin a holder's active model, e.g. when its session ends"""
+        with self._lock:
+            key = self._active.pop(holder, None)
+            if key is not None:
+                self.unpin(*key)
+                self._make_room(0)
+    
+    def pin(self, model_id, backend=None):
+        """Keep a model loaded until a matching `unpin`, starting its load if needed"""
+        with self._lock:
+            self.loader(model_id, backend)
+            self._entries[self._key(model_id, backend)].pins += 1
+    
+    def unpin(self, model_id, backend=None):
+        """Release a `pin`; the model can be evicted again once no pins are left"""
+        with self._lock:
+            entry = self._entries.get(self._key(model_id, backend))
+            if entry is not None and entry.pins:
+                entry.pins -= 1
+    
+    @contextlib.contextmanager
+    def using(self, model_id, timeout=None, backend=None):
+        """Pin a model for the duration of a `with` block and yield its pipeline"""
+        self.pin(model_id, backend)
+        try:
+            yield self.get(model_id, timeout, backend)
+        finally:
+            self.unpin(model_id, backend)
+    
+    def resident_bytes(self):
+        """Bytes taken by the loaded models together"""
+        with self._lock:
+            return sum(entry.resident_bytes or 0 for entry in self._entries.values())
+    
+    def _loaded(self, key, entry, tagger):
+        size = weight_bytes(tagger.model)
+        if size is None:
+            size = max(0, rss_bytes() - entry.rss_before)
+        with self._lock:
+            entry.resident_bytes = self._sizes[key] = size
+            self._make_room(0)
+    
+    def _make_room(self, incoming):
+        """Evict least recently used models until `incoming` more bytes fit in the budget
+        
+        Models still loading, pinned models, active ones among them, and the
+        most recently used model are kept.
+        """
+        evicted = False
+        for key, entry in list(self._entries.items())[:-1]:
+            if self.resident_bytes() + incoming <= self.budget_bytes:
+                break
+            if entry.resident_bytes is None or entry.pins:
+                continue
+            del self._entries[key]
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            # Free the weights now rather than whenever the pipelines' reference cycles are next collected
+            gc.collect()
+    
+    def stats(self):
+        """Return the budget, total resident size, eviction count and, per model, its backend, state, load time and size
+        
+        Models are listed most recently used first.
+        """
+        with self._lock:
+            entries = list(self._entries.items())[::-1]
+            models = []
+            for key, entry in entries:
+                timings = entry.loader.timings()
+                state = "failed" if entry.loader.error is not None else "ready" if entry.loader.ready else "loading"
+                models.append({
+                    'model_id': key[0],
+                    'backend': key[1],
+                    'state': state,
+                    'active': key in self._active.values(),
+                    'pinned': entry.pins > 0,
+                    'load_seconds': timings.get('load_seconds'),
+                    'warmup_seconds': timings.get('warmup_seconds'),
+                    'resident_bytes': entry.resident_bytes,
+                    'last_used': entry.last_used
+                })
+            return {
+                'budget_bytes': self.budget_bytes,
+                'resident_bytes': self.resident_bytes(),
+                'evictions': self.evictions,
+                'models': models
+            }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load models through a memory-bounded pool and report their sizes")
+    parser.add_argument("models", nargs="*", default=list(POOL_MODEL_IDS),
+                        help="Model ids or local paths, activated in order (default: flan-t5 small, base and large)")
+    parser.add_argument("--backend", choices=list(MODEL_BACKENDS), default="torch", help="Inference backend")
+    parser.add_argument("--budget-mb", type=float, default=MODEL_POOL_BUDGET_BYTES / 1024 ** 2,
+                        help=f"RAM budget for the loaded models in MB (default: {MODEL_POOL_BUDGET_BYTES // 1024 ** 2})")
+    args = parser.parse_args(argv)
+    
+    pool = ModelPool(int(args.budget_mb * 1024 ** 2), backend=args.backend)
+    for i, model_id in enumerate(args.models):
+        # Each model is preloaded while the previous one tags, as the app does with "Preload next model"
+        loader = pool.activate(model_id, preload=args.models[i + 1] if i + 1 < len(args.models) else None)
+        process_ticket(loader.wait(), "My payment failed and the page shows an error")
+    print(json.dumps(pool.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Bounded, columnar store for the tagged results shown in a UI session"""
+import json
+import os
+import uuid
+
+import pandas as pd
+
+# Results held in memory per session before the oldest are spilled to disk
+RESULTS_MAX_ROWS = 500
+
+# Where each session's spilled results are appended
+RESULTS_SPILL_DIR = os.path.join("tagged_output", "sessions")
+
+# Columns kept for every result
+RESULT_COLUMNS = [
+    "text", "zero_shot", "few_shot", "zero_shot_scores", "few_shot_scores", "clipped_tokens", "tagged_by",
+    "student_confidence", "few_shot_skipped", "timestamp"
+]
+
+# Columns stored as JSON and left empty when a result lacks them: scores when the mode produced none,
+# clipped_tokens unless the ticket was clipped to the token budget, tagged_by and student_confidence
+# unless the student cascade ran, few_shot_skipped unless tagging was adaptive
+JSON_COLUMNS = [
+    "zero_shot_scores", "few_shot_scores", "clipped_tokens", "tagged_by", "student_confidence", "few_shot_skipped"
+]
+
+# A session sees few distinct tag combinations, so these compress well as categories
+CATEGORICAL_COLUMNS = ["zero_shot", "few_shot"]
+
+def _typed(frame):
+    """Give a results frame its compact column types"""
+    return frame.reindex(columns=RESULT_COLUMNS).astype(
+        {column: "category" if column in CATEGORICAL_COLUMNS else "string" for column in RESULT_COLUMNS}
+    )
+
+class ResultStore:
+    """Keeps tagged results in a typed pandas frame instead of a list of dicts
+    
+    Appends are buffered and folded into the frame on the next read. Once more
+    than `max_rows` results are held, the oldest are appended to a CSV file in
+    `spill_dir`, or dropped when `spill_dir` is None. Pages are served newest
+    first and read from the spill file when they reach past the rows in memory.
+    """
+    def __init__(self, max_rows=RESULTS_MAX_ROWS, spill_dir=RESULTS_SPILL_DIR):
+        self.max_rows = max_rows
+        self.spill_path = os.path.join(spill_dir, f"{uuid.uuid4().hex[:12]}.csv") if spill_dir else None
+        self.spilled = 0
+        self.dropped = 0
+        self._frame = _typed(pd.DataFrame())
+        self._pending = []
+    
+    def add(self, result):
+        """Append one result dict"""
+        row = {column: result.get(column) for column in RESULT_COLUMNS}
+        for column in JSON_COLUMNS:
+            if row[column] is not None:
+                row[column] = json.dumps(row[column])
+        self._pending.append(row)
+    
+    def __len__(self):
+        self._flush()
+        return self.spilled + len(self._frame)
+    
+    def memory_bytes(self):
+        """Bytes used by the in-memory results"""
+        self._flush()
+        return int(self._frame.memory_usage(deep=True).sum())
+    
+    def _flush(self):
+        if not self._pending:
+            return
+        frame = _typed(pd.concat(
+            [self._frame.astype(object), pd.DataFrame(self._pending, columns=RESULT_COLUMNS)], ignore_index=True
+        ))
+        self._pending = []
+        overflow = len(frame) - self.max_rows
+        if overflow > 0:
+            self._spill(frame.iloc[:overflow])
+            frame = frame.iloc[overflow:].reset_index(drop=True)
+        self._frame = frame
+    
+    def _spill(self, rows):
+        if self.spill_path is None:
+            self.dropped += len(rows)
+            return
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        rows.to_csv(self.spill_path, mode="a", header=self.spilled == 0, index=False)
+        self.spilled += len(rows)
+    
+    def page_count(self, page_size):
+        """Number of pages of `page_size` results"""
+        return max(1, -(-len(self) // page_size))
+    
+    def page(self, number, page_size):
+        """Return page `number` (0 is the newest) as a list of result dicts, newest first"""
+        self._flush()
+        start = number * page_size
+        stop = min(start + page_size, len(self))
+        in_memory = len(self._frame)
+        
+        # Index i counts back from the newest result; the frame holds the newest `in_memory` of them
+        frames = []
+        if start < in_memory:
+            frames.append(self._frame.iloc[in_memory - min(stop, in_memory):in_memory - start].iloc[::-1])
+        if stop > in_memory:
+            first = self.spilled - (stop - in_memory)
+            last = self.spilled - max(start - in_memory, 0)
+            spilled = pd.read_csv(
+                self.spill_path, skiprows=range(1, first + 1), nrows=last - first, dtype=str, keep_default_na=False
+            )
+            frames.append(spilled.iloc[::-1])
+        return [record for frame in frames for record in self._records(frame)]
+    
+    @staticmethod
+    def _records(frame):
+        records = []
+        for row in frame.astype(object).to_dict("records"):
+            for column in JSON_COLUMNS:
+                value = row.pop(column)
+                if not pd.isna(value) and value != "":
+                    row[column] = json.loads(value)
+            records.append(row)
+        return records
+    
+    def clear(self):
+        """Drop every result, including any spilled to disk"""
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spilled = 0
+        self.dropped = 0
+        self._frame = _typed(pd.DataFrame())
+        self._pending = []
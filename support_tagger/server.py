@@ -0,0 +1,290 @@
+"""Local HTTP tagging server that coalesces concurrent requests into batches
+
+Usage:
+    python -m support_tagger.server --port 8000 --max-batch-size 16 --max-wait-ms 10
+
+Endpoints:
+    POST /tag                 {"text": "..."} -> {"text", "zero_shot", "few_shot", ...}
+    GET  /metrics             queue depth, batch sizes and p50/p99 latency
+    GET  /metrics/prometheus  per-stage timing histograms in the Prometheus text format
+    GET  /health              {"status": "ok"}
+"""
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from support_tagger.cache import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_PATH, ResultCache
+from support_tagger.cli import add_tagging_arguments
+from support_tagger.examples import load_example_bank
+from support_tagger.student import load_student
+from support_tagger.telemetry import TELEMETRY
+from support_tagger.tagging import (
+    DEFAULT_BATCH_SIZE, DRAFT_MODEL_ID, MODEL_BACKENDS, MODEL_ID, TAGGING_MODES, TICKET_TOKEN_BUDGET, load_model,
+    process_tickets, warm_up
+)
+
+# Number of recent request latencies kept for percentile reporting
+LATENCY_WINDOW = 2000
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sequence, or 0.0 when it is empty"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+class _Request:
+    """A queued ticket waiting to be tagged, with the pipeline and process_tickets options to tag it with"""
+    def __init__(self, text, tagger, options):
+        self.text = text
+        self.tagger = tagger
+        self.options = options
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+class MicroBatcher:
+    """Collects tagging requests from many threads and runs them as batched process_tickets calls
+    
+    A batch is dispatched once `max_batch_size` requests are queued or the
+    oldest request has waited `max_wait` seconds, whichever comes first. A
+    single scheduler thread runs every batch, so callers of the batcher never
+    run inference at the same time as each other.
+    
+    Requests can name a `session`. Batches are filled round-robin, one request
+    per session in turn, so a session that queues many tickets cannot hold
+    back the others. Requests can also bring their own pipeline and
+    process_tickets options; a batch is then split into one call per distinct
+    pipeline and options.
+    """
+    def __init__(self, tagger, max_batch_size=DEFAULT_BATCH_SIZE, max_wait=0.01, mode="generate", cache=None,
+                 token_budget=TICKET_TOKEN_BUDGET, student=None, adaptive=False, example_bank=None):
+        self.tagger = tagger
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.mode = mode
+        self.cache = cache
+        self.token_budget = token_budget
+        self.student = student
+        self.adaptive = adaptive
+        self.example_bank = example_bank
+        self._ready = threading.Condition()
+        # Waiting requests per session, in the order sessions are next served
+        self._pending = OrderedDict()
+        self._queued = 0
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._requests = 0
+        self._student_answered = 0
+        self._batches = 0
+        self._started = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+    
+    def submit(self, text, session=None, tagger=None, **options):
+        """Queue a ticket and return a Future resolving to its result dict
+        
+        `tagger` and any process_tickets `options`, such as `mode` or
+        `student`, replace the batcher's own for this ticket.
+        """
+        request = _Request(text, tagger or self.tagger, options)
+        with self._ready:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._pending.setdefault(session, deque()).append(request)
+            self._queued += 1
+            self._ready.notify()
+        return request.future
+    
+    def tag(self, text, timeout=None, session=None, tagger=None, **options):
+        """Queue a ticket and block until its result is ready"""
+        return self.submit(text, session, tagger, **options).result(timeout)
+    
+    def close(self, timeout=None):
+        """Stop taking tickets, finish the queued ones and stop the scheduler thread"""
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+        self._thread.join(timeout)
+    
+    def _next_batch(self):
+        """Block for the first request, wait until a batch is full or its deadline passes, then take one request per session in turn
+        
+        Returns None once the batcher is closed and nothing is left queued.
+        """
+        with self._ready:
+            while not self._queued and not self._closed:
+                self._ready.wait()
+            if not self._queued:
+                return None
+            deadline = min(requests[0].enqueued for requests in self._pending.values()) + self.max_wait
+            while self._queued < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            batch = []
+            while self._pending and len(batch) < self.max_batch_size:
+                session, requests = self._pending.popitem(last=False)
+                batch.append(requests.popleft())
+                if requests:
+                    # Back of the line until every other waiting session has had a turn
+                    self._pending[session] = requests
+            self._queued -= len(batch)
+        return batch
+    
+    def _groups(self, batch):
+        """Split a batch into (tagger, options, requests) groups that can share one process_tickets call"""
+        groups = []
+        for request in batch:
+            options = {
+                'mode': self.mode, 'cache': self.cache, 'token_budget': self.token_budget, 'student': self.student,
+                'adaptive': self.adaptive, 'example_bank': self.example_bank, **request.options
+            }
+            for tagger, group_options, requests in groups:
+                if tagger is request.tagger and group_options == options:
+                    requests.append(request)
+                    break
+            else:
+                groups.append((request.tagger, options, [request]))
+        return groups
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            for tagger, options, requests in self._groups(batch):
+                try:
+                    results = process_tickets(
+                        tagger, [request.text for request in requests], batch_size=self.max_batch_size, **options
+                    )
+                except Exception as e:
+                    for request in requests:
+                        request.future.set_exception(e)
+                    continue
+                
+                finished = time.monotonic()
+                for request, result in zip(requests, results):
+                    request.future.set_result(result)
+                with self._stats_lock:
+                    self._latencies.extend(finished - request.enqueued for request in requests)
+                    self._requests += len(requests)
+                    self._student_answered += sum(result.get('tagged_by') == "student" for result in results)
+            with self._stats_lock:
+                self._batches += 1
+    
+    def stats(self):
+        """Return queue depth, batch counts, throughput and latency percentiles in milliseconds"""
+        with self._stats_lock:
+            latencies = list(self._latencies)
+            requests, batches, student_answered = self._requests, self._batches, self._student_answered
+        elapsed = time.monotonic() - self._started
+        return {
+            'queue_depth': self._queued,
+            'requests': requests,
+            'batches': batches,
+            'mean_batch_size': requests / batches if batches else 0.0,
+            'requests_per_second': requests / elapsed if elapsed > 0 else 0.0,
+            'routed_fraction': 1 - student_answered / requests if requests else 0.0,
+            'latency_p50_ms': percentile(latencies, 50) * 1000,
+            'latency_p99_ms': percentile(latencies, 99) * 1000
+        }
+
+def make_handler(batcher, request_timeout=300):
+    """Build a request handler class bound to a MicroBatcher"""
+    class TaggingHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send_json(200, batcher.stats())
+            elif self.path == "/metrics/prometheus":
+                body = TELEMETRY.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path == "/health":
+                self._send_json(200, {'status': "ok"})
+            else:
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+        
+        def do_POST(self):
+            if self.path != "/tag":
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                text = json.loads(self.rfile.read(length))['text']
+                if not isinstance(text, str) or not text.strip():
+                    raise ValueError("'text' must be a non-empty string")
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {'error': f"Expected a JSON body like {{\"text\": \"...\"}}: {e}"})
+                return
+            try:
+                result = batcher.tag(text.strip(), timeout=request_timeout)
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, result)
+        
+        def log_message(self, format, *args):
+            # Per-request access logs would dominate the output under load
+            pass
+    
+    return TaggingHandler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ticket tagging over HTTP with dynamic micro-batching")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Most tickets per batch")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0,
+                        help="Longest time the first ticket in a batch waits for others (default: 10)")
+    parser.add_argument("--mode", choices=list(TAGGING_MODES), default="generate", help="Tagging mode")
+    parser.add_argument("--model", default=MODEL_ID, help="Model id or local path")
+    parser.add_argument("--backend", choices=list(MODEL_BACKENDS), default="torch", help="Inference backend")
+    parser.add_argument("--draft-model", default=DRAFT_MODEL_ID, help="Draft model id or local path for --mode greedy-assisted")
+    parser.add_argument("--cache", default=RESULT_CACHE_PATH, help="Result cache path")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the result cache")
+    add_tagging_arguments(parser)
+    parser.add_argument("--no-telemetry", action="store_true", help="Do not record per-stage timings")
+    args = parser.parse_args(argv)
+    
+    TELEMETRY.enabled = not args.no_telemetry
+    tagger = load_model(
+        args.model, backend=args.backend, draft_model_id=args.draft_model if args.mode == "greedy-assisted" else None
+    )
+    # Warm up before accepting requests so the first caller does not pay for it
+    warm_up(tagger, batch_size=args.max_batch_size, mode=args.mode)
+    cache = None if args.no_cache else ResultCache(args.cache, RESULT_CACHE_MAX_ENTRIES)
+    student = load_student(args.student, args.student_confidence) if args.student else None
+    batcher = MicroBatcher(
+        tagger, max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000, mode=args.mode, cache=cache,
+        token_budget=args.token_budget or None, student=student, adaptive=args.adaptive,
+        example_bank=load_example_bank(args.examples, args.examples_k) if args.examples else None
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher))
+    print(f"Serving on http://{args.host}:{args.port} (POST /tag, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Background model loading and warmup for fast cold starts
+
+Usage:
+    python -m support_tagger.startup --snapshot   # save a pinned local snapshot of the model
+    python -m support_tagger.startup              # load, warm up and print startup timings
+"""
+import argparse
+import importlib
+import json
+import threading
+import time
+
+from support_tagger.tagging import MODEL_BACKENDS, MODEL_ID, load_model, process_ticket, save_snapshot, warm_up
+
+class ModelLoader:
+    """Loads a model on a background thread, then warms it up with a small batch
+    
+    `wait` returns the pipeline as soon as it is loaded, while the warmup batch
+    keeps running in the background. `on_loaded` is called with the pipeline
+    once it is ready. Timings of each startup stage, and the time from starting
+    the load to the first real tag, are available from `timings`.
+    """
+    def __init__(self, model_id=MODEL_ID, backend="torch", warmup=True, on_loaded=None):
+        self.model_id = model_id
+        self.backend = backend
+        self.warmup = warmup
+        self.on_loaded = on_loaded
+        self.tagger = None
+        self.error = None
+        self._loaded = threading.Event()
+        self._timings_lock = threading.Lock()
+        self._timings = {}
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+        self._thread.start()
+    
+    @property
+    def ready(self):
+        """Whether the model loaded successfully"""
+        return self._loaded.is_set() and self.error is None
+    
+    def _record(self, name, seconds):
+        with self._timings_lock:
+            self._timings.setdefault(name, seconds)
+    
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            # Timed on its own because importing torch and transformers is most of a cold start
+            importlib.import_module("transformers.pipelines")
+            self._record('import_seconds', time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            self.tagger = load_model(self.model_id, backend=self.backend)
+            self._record('load_seconds', time.perf_counter() - start)
+            self._record('ready_seconds', time.monotonic() - self._started)
+            if self.on_loaded is not None:
+                self.on_loaded(self.tagger)
+        except Exception as e:
+            self.error = e
+            return
+        finally:
+            self._loaded.set()
+        
+        if self.warmup:
+            try:
+                self._record('warmup_seconds', warm_up(self.tagger))
+            except Exception:
+                # A model that cannot tag the warmup batch reports the same error on the first real call
+                pass
+    
+    def wait(self, timeout=None):
+        """Block until the model is loaded and return the pipeline, re-raising any load error"""
+        if not self._loaded.wait(timeout):
+            raise TimeoutError(f"{self.model_id} did not load within {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.tagger
+    
+    def join(self, timeout=None):
+        """Wait for loading and the warmup batch to finish"""
+        self._thread.join(timeout)
+    
+    def record_first_tag(self):
+        """Note that a real ticket has been tagged; only the first call is kept"""
+        self._record('time_to_first_tag_seconds', time.monotonic() - self._started)
+    
+    def timings(self):
+        """Return the startup timings recorded so far, in seconds"""
+        with self._timings_lock:
+            return dict(self._timings)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Save a local model snapshot or measure cold-start timings")
+    parser.add_argument("--model", default=MODEL_ID, help="Model id on the hub")
+    parser.add_argument("--backend", choices=list(MODEL_BACKENDS), default="torch", help="Inference backend")
+    parser.add_argument("--snapshot", action="store_true", help="Download the model and save a local safetensors snapshot")
+    parser.add_argument("--revision", default=None, help="Hub revision to pin the snapshot to (default: main)")
+    args = parser.parse_args(argv)
+    
+    if args.snapshot:
+        print(f"Saved {args.model} to {save_snapshot(args.model, revision=args.revision)}")
+        return
+    
+    loader = ModelLoader(args.model, backend=args.backend, warmup=True)
+    # Tag as soon as the model is ready, as a user would, while the warmup may still be running
+    process_ticket(loader.wait(), "My payment failed and the page shows an error")
+    loader.record_first_tag()
+    loader.join()
+    print(json.dumps(loader.timings(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Chunked, checkpointed CSV tagging with incremental output"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from support_tagger.telemetry import TELEMETRY
+
+# Rows read, tagged and checkpointed at a time
+DEFAULT_CHUNK_SIZE = 1000
+
+def _file_fingerprint(file, block_size=1 << 20):
+    """Hash a file object block by block so a checkpoint can be matched to its input"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(block_size), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+def _load_checkpoint(path, fingerprint):
+    """Return the checkpoint at `path` if it belongs to the input with this fingerprint"""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return checkpoint if checkpoint.get('source') == fingerprint else None
+
+def _save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically so a crash never leaves a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def _results_frame(chunk, results):
+    """Append tag columns to a chunk of input rows"""
+    frame = chunk.reset_index(drop=True)
+    for key in ('zero_shot', 'few_shot'):
+        frame[key] = [result[key] for result in results]
+        # Tickets the student answers have no scores, so look past the first result
+        if any(f'{key}_scores' in result for result in results):
+            frame[f'{key}_scores'] = [json.dumps(result.get(f'{key}_scores')) for result in results]
+    # Set on every result when a student answers first, so later chunks get the same columns
+    for key in ('tagged_by', 'student_confidence'):
+        if any(key in result for result in results):
+            frame[key] = [result.get(key) for result in results]
+    # Set on every model-tagged result in adaptive mode
+    if any('few_shot_skipped' in result for result in results):
+        frame['few_shot_skipped'] = [result.get('few_shot_skipped', False) for result in results]
+    return frame
+
+def stream_tickets(source, output_path, tag_chunk, output_format="csv", chunk_size=DEFAULT_CHUNK_SIZE,
+                   progress_callback=None):
+    """Tag a CSV file chunk by chunk, writing results incrementally and resuming from the last checkpoint
+    
+    `tag_chunk(texts, progress)` is called with each chunk's ticket texts and
+    must return one result dict per text, as `process_tickets` does. It may
+    call `progress(done, total)` as it goes, as process_tickets calls its
+    `progress_callback`, to report progress within the chunk. Only one chunk
+    is held in memory at a time. CSV output is appended to
+    `output_path`; Parquet output is written as one part file per chunk inside
+    the `output_path` directory. After each chunk the input offset is saved to
+    `<output_path>.checkpoint.json`, so rerunning on the same input continues
+    where it stopped. `progress_callback(rows_done, fraction)` is called per chunk
+    and whenever `tag_chunk` reports progress.
+    Returns the total rows tagged, the rows tagged by this call and the results
+    of the last chunk.
+    """
+    checkpoint_path = f"{output_path}.checkpoint.json"
+    fingerprint = _file_fingerprint(source)
+    checkpoint = _load_checkpoint(checkpoint_path, fingerprint)
+    if checkpoint is None or checkpoint.get('format') != output_format or not os.path.exists(output_path):
+        checkpoint = {'source': fingerprint, 'format': output_format, 'offset': 0, 'output_size': 0, 'complete': False}
+    if checkpoint['complete']:
+        return checkpoint['offset'], 0, []
+    start_offset = checkpoint['offset']
+    
+    if output_format == "csv":
+        # Drop anything written after the last checkpoint before appending again
+        with open(output_path, "ab") as f:
+            f.truncate(checkpoint['output_size'])
+    else:
+        os.makedirs(output_path, exist_ok=True)
+    
+    source.seek(0, os.SEEK_END)
+    total_bytes = source.tell() or 1
+    source.seek(0)
+    
+    last_results = []
+    # Where the input stood before the current chunk; unknown when resuming until a chunk is done
+    last_fraction = 0.0 if start_offset == 0 else None
+    with pd.read_csv(source, chunksize=chunk_size, skiprows=range(1, checkpoint['offset'] + 1)) as reader:
+        while True:
+            with TELEMETRY.stage("read"):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            if 'ticket_text' not in chunk.columns:
+                raise ValueError("CSV must contain a 'ticket_text' column")
+            
+            chunk_fraction = min(source.tell() / total_bytes, 1.0)
+            start_fraction = chunk_fraction if last_fraction is None else last_fraction
+            
+            def chunk_progress(done, total):
+                # Rows and input read within the chunk are estimated from the share of prompts done
+                if progress_callback and total:
+                    share = done / total
+                    progress_callback(
+                        checkpoint['offset'] + int(len(chunk) * share),
+                        start_fraction + (chunk_fraction - start_fraction) * share
+                    )
+            
+            results = tag_chunk(chunk['ticket_text'].astype(str).tolist(), chunk_progress)
+            with TELEMETRY.stage("write"):
+                frame = _results_frame(chunk, results)
+                if output_format == "csv":
+                    if checkpoint['offset']:
+                        # Optional columns come and go between chunks; keep the ones the file started with
+                        frame = frame.reindex(columns=pd.read_csv(output_path, nrows=0).columns)
+                    frame.to_csv(output_path, mode="a", header=checkpoint['offset'] == 0, index=False)
+                    checkpoint['output_size'] = os.path.getsize(output_path)
+                else:
+                    frame.to_parquet(os.path.join(output_path, f"part-{checkpoint['offset']:09d}.parquet"), index=False)
+                
+                checkpoint['offset'] += len(chunk)
+                _save_checkpoint(checkpoint_path, checkpoint)
+            last_results = results
+            last_fraction = chunk_fraction
+            if progress_callback:
+                progress_callback(checkpoint['offset'], chunk_fraction)
+    
+    checkpoint['complete'] = True
+    _save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint['offset'], checkpoint['offset'] - start_offset, last_results
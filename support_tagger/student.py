@@ -0,0 +1,239 @@
+"""Small linear tag classifier distilled from the model's own results
+
+The student is a multi-label logistic regression over hashed word unigrams and
+bigrams, with one head per prompt type. It is trained on tagged CSV or Parquet
+output, e.g. the files written by CSV jobs and the batch command. When passed
+to `process_tickets` it acts as a cascade front stage: tickets it is confident
+about are answered without the model, and only the rest reach the transformer.
+
+Usage:
+    python -m support_tagger.student train tagged_output/jobs/*_tagged.csv
+    python -m support_tagger.student evaluate holdout_tagged.csv
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from support_tagger.cache import normalize_ticket_text
+from support_tagger.tagging import ALL_TAGS
+
+# Where the trained student is saved and loaded from by default
+STUDENT_PATH = "student_model.npz"
+
+# Hashed feature space; collisions are rare at this size for ticket vocabularies
+STUDENT_FEATURES = 2 ** 17
+
+# Lowest confidence at which the student answers instead of routing the ticket to the model
+STUDENT_CONFIDENCE = 0.8
+
+# Result keys the student learns, one classifier head each
+PROMPT_TYPES = ("zero_shot", "few_shot")
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+def features(text, n_features=STUDENT_FEATURES):
+    """Hashed indices of a ticket's word unigrams and bigrams; index 0 is a bias feature every ticket has"""
+    words = _WORD_PATTERN.findall(normalize_ticket_text(text))
+    grams = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    hashed = {zlib.crc32(gram.encode("utf-8")) % (n_features - 1) + 1 for gram in grams}
+    return np.array([0, *sorted(hashed)], dtype=np.int64)
+
+def _tag_matrix(tag_lists):
+    """Binary matrix with one row per tag list and one column per tag in ALL_TAGS"""
+    column = {tag: i for i, tag in enumerate(ALL_TAGS)}
+    matrix = np.zeros((len(tag_lists), len(ALL_TAGS)), dtype=np.float32)
+    for row, tags in enumerate(tag_lists):
+        for tag in tags:
+            if tag in column:
+                matrix[row, column[tag]] = 1.0
+    return matrix
+
+def _split_tags(value):
+    return [tag.strip() for tag in str(value).split(",") if tag.strip()]
+
+class StudentClassifier:
+    """Hashed n-gram logistic regression predicting 3 tags per prompt type, with a confidence"""
+    def __init__(self, weights, threshold=STUDENT_CONFIDENCE):
+        self.weights = weights
+        self.n_features = weights.shape[0]
+        self.threshold = threshold
+    
+    @classmethod
+    def train(cls, texts, tags, epochs=8, learning_rate=0.5, batch_size=64, n_features=STUDENT_FEATURES, seed=0):
+        """Fit the student to tagger results
+        
+        `tags` maps each prompt type to one tag list per text. Training runs
+        minibatch Adagrad on the logistic loss, updating only the weight rows
+        of features present in each batch.
+        """
+        rows = [features(text, n_features) for text in texts]
+        targets = np.hstack([_tag_matrix(tags[prompt_type]) for prompt_type in PROMPT_TYPES])
+        weights = np.zeros((n_features, targets.shape[1]), dtype=np.float32)
+        squared_gradients = np.zeros_like(weights)
+        rng = np.random.default_rng(seed)
+        
+        for _ in range(epochs):
+            order = rng.permutation(len(rows))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                indices, offsets, lengths = cls._flatten([rows[i] for i in batch])
+                errors = 1 / (1 + np.exp(-np.add.reduceat(weights[indices], offsets))) - targets[batch]
+                touched, inverse = np.unique(indices, return_inverse=True)
+                gradient = np.zeros((len(touched), weights.shape[1]), dtype=np.float32)
+                np.add.at(gradient, inverse, np.repeat(errors, lengths, axis=0))
+                squared_gradients[touched] += gradient ** 2
+                weights[touched] -= learning_rate * gradient / (np.sqrt(squared_gradients[touched]) + 1e-8)
+        return cls(weights)
+    
+    @staticmethod
+    def _flatten(rows):
+        """Concatenate per-ticket feature indices with the offset and length of each ticket's run"""
+        lengths = np.array([len(row) for row in rows])
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        return np.concatenate(rows), offsets, lengths
+    
+    def predict(self, texts):
+        """Return (tags per prompt type, confidence) for every text
+        
+        Each head keeps its 3 most probable tags. Confidence is the lowest, over
+        both heads, of the third tag's probability and one minus the fourth's,
+        so it is high only when the student is sure which 3 tags apply.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        indices, offsets, _ = self._flatten([features(text, self.n_features) for text in texts])
+        probs = 1 / (1 + np.exp(-np.add.reduceat(self.weights[indices], offsets)))
+        probs = probs.reshape(len(texts), len(PROMPT_TYPES), len(ALL_TAGS))
+        order = np.argsort(-probs, axis=-1)
+        ranked = np.take_along_axis(probs, order, axis=-1)
+        confidence = np.minimum(ranked[..., 2], 1 - ranked[..., 3]).min(axis=-1)
+        return [
+            ({
+                prompt_type: [ALL_TAGS[i] for i in order[row, head, :3]]
+                for head, prompt_type in enumerate(PROMPT_TYPES)
+            }, float(confidence[row]))
+            for row in range(len(texts))
+        ]
+    
+    def save(self, path=STUDENT_PATH):
+        """Save the weights, threshold and tag set to an .npz file"""
+        np.savez_compressed(path, weights=self.weights, threshold=self.threshold, tags=np.array(ALL_TAGS))
+    
+    @classmethod
+    def load(cls, path=STUDENT_PATH):
+        """Load a student saved with `save`"""
+        with np.load(path) as data:
+            if list(data['tags']) != ALL_TAGS:
+                raise ValueError(f"{path} was trained on a different tag set; train the student again")
+            return cls(data['weights'], float(data['threshold']))
+
+_students = {}
+
+def load_student(path=STUDENT_PATH, threshold=None):
+    """Return the student saved at `path`, reloading it only when the file changes
+    
+    A `threshold` overrides the saved one without touching the shared copy.
+    Students are kept per path and threshold, so callers asking for the same
+    threshold get the same instance and the micro-batcher can put their
+    tickets in one call.
+    """
+    stamp = os.path.getmtime(path)
+    cached = _students.get((path, threshold))
+    if cached is None or cached[0] != stamp:
+        student = StudentClassifier.load(path) if threshold is None else StudentClassifier(load_student(path).weights, threshold)
+        cached = _students[(path, threshold)] = (stamp, student)
+    return cached[1]
+
+def read_tagged(paths):
+    """Read tagged CSV or Parquet outputs into one frame of model-tagged rows, one row per distinct ticket
+    
+    Rows the student answered itself are left out, so it never learns from its
+    own guesses, and so are rows whose few-shot prompt was skipped, whose
+    few-shot tags only repeat the zero-shot ones.
+    """
+    frames = [pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path) for path in paths]
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    missing = {'ticket_text', *PROMPT_TYPES} - set(frame.columns)
+    if missing:
+        raise ValueError(f"Tagged files need {', '.join(sorted(missing))} columns")
+    if 'tagged_by' in frame.columns:
+        frame = frame[frame['tagged_by'] != "student"]
+    if 'few_shot_skipped' in frame.columns:
+        frame = frame[frame['few_shot_skipped'].astype(str) != "True"]
+    frame = frame.dropna(subset=['ticket_text', *PROMPT_TYPES])
+    return frame[~frame['ticket_text'].astype(str).map(normalize_ticket_text).duplicated()].reset_index(drop=True)
+
+def evaluate(student, texts, tags, thresholds=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95)):
+    """Report, per confidence threshold, the routed fraction and agreement with the teacher
+    
+    Agreement counts tickets whose predicted tag set equals the teacher's, for
+    each prompt type and for both. `cascade` is the agreement of the whole
+    cascade, where routed tickets get the teacher's own tags.
+    """
+    predictions = student.predict(texts)
+    matches = np.array([
+        [set(predicted[prompt_type]) == set(tags[prompt_type][i]) for prompt_type in PROMPT_TYPES]
+        for i, (predicted, _) in enumerate(predictions)
+    ]).reshape(len(texts), len(PROMPT_TYPES))
+    confidence = np.array([confidence for _, confidence in predictions])
+    report = []
+    for threshold in thresholds:
+        answered = confidence >= threshold
+        kept = matches[answered]
+        report.append({
+            'threshold': threshold,
+            'routed_fraction': float(1 - answered.mean()) if len(texts) else 0.0,
+            'answered': int(answered.sum()),
+            'agreement': {
+                **{prompt_type: float(kept[:, i].mean()) if len(kept) else None for i, prompt_type in enumerate(PROMPT_TYPES)},
+                'both': float(kept.all(axis=1).mean()) if len(kept) else None
+            },
+            'cascade': float((~answered | matches.all(axis=1)).mean()) if len(texts) else 0.0
+        })
+    return report
+
+def _examples(frame):
+    texts = frame['ticket_text'].astype(str).tolist()
+    return texts, {prompt_type: frame[prompt_type].map(_split_tags).tolist() for prompt_type in PROMPT_TYPES}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or evaluate the distilled student tag classifier")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="Fit the student to tagged CSV or Parquet files")
+    train.add_argument("inputs", nargs="*", help="Tagged files (default: every CSV job output under tagged_output/jobs)")
+    train.add_argument("--output", default=STUDENT_PATH, help=f"Where to save the student (default: {STUDENT_PATH})")
+    train.add_argument("--epochs", type=int, default=8, help="Passes over the training tickets (default: 8)")
+    train.add_argument("--holdout", type=float, default=0.2, help="Share of tickets held out for evaluation (default: 0.2)")
+    train.add_argument("--confidence", type=float, default=STUDENT_CONFIDENCE,
+                       help=f"Confidence threshold saved with the student (default: {STUDENT_CONFIDENCE})")
+    train.add_argument("--seed", type=int, default=0, help="Random seed for the split and training order")
+    evaluate_parser = commands.add_parser("evaluate", help="Compare a saved student with the tags in tagged files")
+    evaluate_parser.add_argument("inputs", nargs="+", help="Tagged CSV or Parquet files")
+    evaluate_parser.add_argument("--model", default=STUDENT_PATH, help=f"Saved student (default: {STUDENT_PATH})")
+    args = parser.parse_args(argv)
+    
+    if args.command == "evaluate":
+        texts, tags = _examples(read_tagged(args.inputs))
+        print(json.dumps(evaluate(load_student(args.model), texts, tags), indent=2))
+        return
+    
+    frame = read_tagged(args.inputs or sorted(glob.glob(os.path.join("tagged_output", "jobs", "*_tagged.csv"))))
+    frame = frame.sample(frac=1.0, random_state=args.seed).reset_index(drop=True)
+    holdout = int(len(frame) * args.holdout)
+    train_texts, train_tags = _examples(frame.iloc[holdout:])
+    student = StudentClassifier.train(train_texts, train_tags, epochs=args.epochs, seed=args.seed)
+    student.threshold = args.confidence
+    student.save(args.output)
+    print(f"Trained on {len(train_texts)} tickets and saved to {args.output}")
+    if holdout:
+        print(json.dumps(evaluate(student, *_examples(frame.iloc[:holdout])), indent=2))
+
+if __name__ == "__main__":
+    main()
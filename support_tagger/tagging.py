@@ -0,0 +1,835 @@
+"""Prompt building, model inference and tag validation for support tickets"""
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from support_tagger.cache import normalize_ticket_text
+from support_tagger.keywords import KEYWORDS
+from support_tagger.telemetry import TELEMETRY
+
+# torch and transformers take seconds to import, so they are imported inside the
+# functions that need them; importing this module stays cheap until a model loads
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+# Predefined tag set
+ALL_TAGS = ["internet", "account", "payment", "technical", "login", "error", "server", "website", "reset", "password", "connectivity", "crash"]
+
+MODEL_ID = "google/flan-t5-base"
+
+# Smaller model sharing MODEL_ID's tokenizer, used as the draft in assisted generation
+DRAFT_MODEL_ID = "google/flan-t5-small"
+
+# Generation settings shared by every tagger call
+GENERATION_KWARGS = {"max_new_tokens": 20, "do_sample": False}
+
+# Number of prompts sent to the pipeline per generate call in batch mode
+DEFAULT_BATCH_SIZE = 16
+
+# Most ticket tokens spliced into a prompt; longer tickets are clipped, None keeps every token
+TICKET_TOKEN_BUDGET = 256
+
+# Share of the budget taken from the start of a clipped ticket; the rest comes from its end,
+# where pasted logs usually carry the actual error
+TICKET_HEAD_FRACTION = 0.75
+
+# Zero-shot tags the ticket's keyword matches must confirm before adaptive tagging skips the few-shot prompt
+ADAPTIVE_KEYWORD_AGREEMENT = 2
+
+# Short, varied tickets run once after loading so the first real ticket is not the slow one
+WARMUP_TICKETS = [
+    "I cannot log in to my account after resetting my password",
+    "The website shows a 500 error when I try to pay",
+    "Wifi keeps disconnecting and the app crashes"
+]
+
+# Where exported ONNX models are saved so the export only runs once per model
+ONNX_EXPORT_DIR = "onnx_models"
+
+# Where pinned local model snapshots are saved; a snapshot is used instead of the hub when present
+MODEL_SNAPSHOT_DIR = "model_snapshots"
+
+# ============================================================================
+# MODEL LOADING
+# ============================================================================
+def _model_dir_name(source):
+    """Directory name for a hub id or local model path, e.g. google--flan-t5-base"""
+    if os.path.isdir(source):
+        return os.path.basename(os.path.normpath(source))
+    return source.strip("/").replace("/", "--")
+
+def snapshot_path(model_id=MODEL_ID):
+    """Local snapshot directory for a model id"""
+    return os.path.join(MODEL_SNAPSHOT_DIR, _model_dir_name(model_id))
+
+def save_snapshot(model_id=MODEL_ID, revision=None):
+    """Download a model at a pinned revision and save it as a local safetensors snapshot; returns its path"""
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+    
+    path = snapshot_path(model_id)
+    AutoTokenizer.from_pretrained(model_id, revision=revision).save_pretrained(path)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_id, revision=revision, low_cpu_mem_usage=True)
+    model.save_pretrained(path, safe_serialization=True)
+    with open(os.path.join(path, "snapshot.json"), "w") as f:
+        json.dump({'model_id': model_id, 'revision': revision or "main", 'saved': datetime.now().isoformat()}, f, indent=2)
+    return path
+
+def _load_torch(source):
+    """Full-precision PyTorch model"""
+    from transformers import AutoModelForSeq2SeqLM
+    
+    if os.path.isdir(source):
+        # Safetensors weights are memory-mapped rather than read into a second copy
+        return AutoModelForSeq2SeqLM.from_pretrained(
+            source, low_cpu_mem_usage=True, use_safetensors=True, local_files_only=True
+        )
+    return AutoModelForSeq2SeqLM.from_pretrained(source, low_cpu_mem_usage=True)
+
+def _load_int8(source):
+    """PyTorch model with its linear layers dynamically quantized to int8"""
+    import torch
+    
+    model = _load_torch(source)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _load_onnx(source):
+    """ONNX Runtime encoder/decoder with KV cache, exported on first use"""
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError(
+            "The 'onnx' backend needs Optimum with ONNX Runtime: pip install 'optimum[onnxruntime]'"
+        ) from e
+    
+    export_path = os.path.join(ONNX_EXPORT_DIR, _model_dir_name(source))
+    if os.path.isdir(export_path):
+        return ORTModelForSeq2SeqLM.from_pretrained(export_path, use_cache=True)
+    model = ORTModelForSeq2SeqLM.from_pretrained(source, export=True, use_cache=True)
+    model.save_pretrained(export_path)
+    return model
+
+# Inference backends selectable in load_model
+MODEL_BACKENDS = {
+    "torch": _load_torch,
+    "int8": _load_int8,
+    "onnx": _load_onnx
+}
+
+def _model_source(model_id):
+    """The local snapshot of a model when one has been saved, otherwise the model id itself"""
+    return snapshot_path(model_id) if os.path.isdir(snapshot_path(model_id)) else model_id
+
+def load_model(model_id=MODEL_ID, backend="torch", draft_model_id=None):
+    """Load the tokenizer and model on the given backend and wrap them in a text2text-generation pipeline
+    
+    The model is read from its local snapshot under MODEL_SNAPSHOT_DIR when one
+    has been saved with `save_snapshot`, and from the hub otherwise. With a
+    `draft_model_id`, the draft model for the "greedy-assisted" mode is loaded now
+    instead of on its first use.
+    """
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {', '.join(MODEL_BACKENDS)}")
+    from transformers import AutoTokenizer, pipeline
+    
+    source = _model_source(model_id)
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=source != model_id)
+    model = MODEL_BACKENDS[backend](source)
+    tagger = pipeline("text2text-generation", model=model, tokenizer=tokenizer)
+    # Recorded on the pipeline so cache keys and reports can tell models and backends apart
+    # however they were loaded
+    tagger.model_id = model_id
+    tagger.backend = backend
+    tagger.source = source
+    if draft_model_id:
+        tagger.draft_model = MODEL_BACKENDS[backend](_model_source(draft_model_id))
+    return TELEMETRY.instrument(tagger)
+
+def draft_model(tagger):
+    """Return the tagger's draft model for assisted generation, loading DRAFT_MODEL_ID on first use"""
+    model = getattr(tagger, "draft_model", None)
+    if model is None:
+        model = tagger.draft_model = MODEL_BACKENDS[getattr(tagger, "backend", "torch")](_model_source(DRAFT_MODEL_ID))
+    return model
+
+def warm_up(tagger, batch_size=DEFAULT_BATCH_SIZE, mode="generate"):
+    """Run a small untimed batch so first-call allocation and kernel selection happen off the critical path
+    
+    This also tokenizes the prompt templates, which every later call reuses.
+    """
+    start = time.perf_counter()
+    _infer_tickets(tagger, WARMUP_TICKETS, _TaggingOptions(batch_size=batch_size, mode=mode))
+    return time.perf_counter() - start
+
+# ============================================================================
+# PROMPTS AND VALIDATION
+# ============================================================================
+def zero_shot_prompt(text):
+    """Generate a zero-shot prompt for ticket classification"""
+    return (
+        f"Classify this support ticket by selecting exactly 3 tags from the following list: {', '.join(ALL_TAGS)}. "
+        f"Choose the most relevant tags based on the ticket's content. Return only the 3 tags separated by commas, no additional text. "
+        f"Ticket: '{text}'"
+    )
+
+# Diverse (ticket, tags) examples shown in every few-shot prompt unless an example bank picks them per ticket
+FEW_SHOT_EXAMPLES = [
+    ("I forgot my password and can't log in.", "login, account, reset"),
+    ("Website keeps crashing with error 500.", "website, error, server"),
+    ("Payment failed but money was charged.", "payment, error, account"),
+    ("My internet connection has been down since yesterday.", "internet, technical, connectivity")
+]
+
+def format_example(number, ticket, tags):
+    """Render one numbered example block of the few-shot prompt"""
+    return f"Example {number}:\nTicket: {ticket}\nTags: {tags}\n\n"
+
+def few_shot_prompt(text, examples=FEW_SHOT_EXAMPLES):
+    """Generate a few-shot prompt with diverse examples for ticket classification"""
+    return (
+        "Classify support tickets by selecting exactly 3 tags from the following list: "
+        f"{', '.join(ALL_TAGS)}. Return only the 3 tags separated by commas, no additional text.\n\n"
+        + "".join(format_example(number, ticket, tags) for number, (ticket, tags) in enumerate(examples, 1))
+        + f"Ticket: {text}\n"
+        "Tags:"
+    )
+
+def validate_and_fix_tags(tags, text, keyword_tags=None):
+    """Validate and fix tags to ensure exactly 3 valid tags
+    
+    `keyword_tags` can carry the keyword matches for `text` when they were
+    already computed for a whole batch with `KEYWORDS.match_series`.
+    """
+    # Split and clean tags
+    tag_list = [tag.strip().lower() for tag in tags.split(",") if tag.strip()]
+    # Filter valid tags
+    valid_tags = [tag for tag in tag_list if tag in ALL_TAGS]
+    
+    # If fewer than 3 tags, add relevant ones based on keywords
+    if len(valid_tags) < 3:
+        # Find matching tags based on whole-word keywords
+        if keyword_tags is None:
+            keyword_tags = KEYWORDS.match(text)
+        matched_tags = [tag for tag in keyword_tags if tag not in valid_tags]
+        
+        # Add matched tags to valid_tags, avoiding duplicates
+        for tag in matched_tags:
+            if tag not in valid_tags and len(valid_tags) < 3:
+                valid_tags.append(tag)
+        
+        # If still fewer than 3 tags, fill with default tags
+        default_tags = ["error", "technical", "issue"]
+        for tag in default_tags:
+            if tag in ALL_TAGS and tag not in valid_tags and len(valid_tags) < 3:
+                valid_tags.append(tag)
+    
+    # Ensure exactly 3 tags
+    return ", ".join(valid_tags[:3])
+
+# Stands in for the ticket text when a prompt template is split or hashed
+TICKET_PLACEHOLDER = "{ticket}"
+
+# Tickets whose spliced prompt ids are compared with tokenizing the whole prompt when an encoder
+# is built; they put punctuation, quotes and line breaks against the ticket slot
+SPLICE_CHECK_TICKETS = [*WARMUP_TICKETS, "Can't pay: \"error 500\" again.\nPlease help!", "wifi"]
+
+class PromptEncoder:
+    """Builds model input ids for the prompt templates without re-tokenizing their fixed text
+    
+    Each template is split at its ticket slot and both halves are tokenized once.
+    Per call only the ticket texts are tokenized, together with any characters
+    the template puts right against them such as quotes, since tokenizers like
+    T5's merge those differently than at a word boundary. The ids are clipped
+    to the token budget and spliced between the cached halves. Few-shot prompts with
+    examples chosen per ticket are assembled the same way, from the
+    instructions, the ticket slot and each example block, tokenized on first use.
+    
+    Splicing assumes the tokenizer handles the text around the slot the same
+    on its own as in context. That is checked on SPLICE_CHECK_TICKETS when the
+    encoder is built; tokenizers that fail the check, e.g. ones that do not
+    normalize line breaks, get whole prompts tokenized per call instead.
+    """
+    def __init__(self, tokenizer, templates=(zero_shot_prompt, few_shot_prompt)):
+        self.tokenizer = tokenizer
+        self._template_fns = list(templates)
+        self.templates = [self._split(template(TICKET_PLACEHOLDER)) for template in templates]
+        # The instructions contain no blank line, so the first one ends them
+        instructions, ticket_slot = few_shot_prompt(TICKET_PLACEHOLDER, examples=()).split("\n\n", 1)
+        self._instructions = self._ids(instructions)
+        self._ticket_slot = self._split(ticket_slot)
+        self._examples = {}
+        self.spliced = self._splices_exactly(SPLICE_CHECK_TICKETS)
+    
+    def _split(self, prompt):
+        """Tokenize the text around the ticket slot, keeping the tokenizer's special tokens at the ends
+        
+        Returns the prefix and suffix ids and the glue: the characters touching
+        the slot on either side, which are tokenized with each ticket instead.
+        """
+        # Special tokens are whatever tokenizing with them adds around the bare ids, e.g. T5's trailing </s>
+        full, bare = self.tokenizer(prompt).input_ids, self._ids(prompt)
+        start = next(i for i in range(len(full) - len(bare) + 1) if full[i:i + len(bare)] == bare)
+        prefix, suffix = prompt.split(TICKET_PLACEHOLDER)
+        glue = (re.search(r"\S*$", prefix).group(), re.match(r"\S*", suffix).group())
+        # Whitespace before the glued ticket is carried by its own first token
+        return (
+            full[:start] + self._ids(prefix[:len(prefix) - len(glue[0])].rstrip()),
+            self._ids(suffix[len(glue[1]):]) + full[start + len(bare):],
+            glue
+        )
+    
+    def _ids(self, text):
+        return self.tokenizer(text, add_special_tokens=False).input_ids if text else []
+    
+    @staticmethod
+    def clip(ids, token_budget):
+        """Fit ticket ids into `token_budget`, keeping its start and end; returns the ids and the number dropped"""
+        if token_budget is None or len(ids) <= token_budget:
+            return ids, 0
+        head = int(token_budget * TICKET_HEAD_FRACTION)
+        return ids[:head] + ids[len(ids) - (token_budget - head):], len(ids) - token_budget
+    
+    def _example_ids(self, number, ticket, tags):
+        key = (number, ticket, tags)
+        ids = self._examples.get(key)
+        if ids is None:
+            ids = self._examples[key] = self._ids(format_example(number, ticket, tags).rstrip())
+        return ids
+    
+    def few_shot_ids(self, ticket_ids, examples):
+        """Input ids of a few-shot prompt showing `examples` for a ticket's clipped ids"""
+        prefix, suffix, _ = self._ticket_slot
+        ids = list(self._instructions)
+        for number, (ticket, tags) in enumerate(examples, 1):
+            ids += self._example_ids(number, ticket, tags)
+        return ids + prefix + ticket_ids + suffix
+    
+    def _ticket_ids(self, texts, token_budget):
+        """Clipped ids and dropped token counts of every ticket, tokenized once per distinct glue"""
+        tickets = {}
+        for _, _, glue in [*self.templates, self._ticket_slot]:
+            if glue not in tickets:
+                glued = [f"{glue[0]}{text}{glue[1]}" for text in texts]
+                tickets[glue] = [
+                    self.clip(ids, token_budget) for ids in self.tokenizer(glued, add_special_tokens=False).input_ids
+                ]
+        return tickets
+    
+    def _assemble(self, tickets, examples):
+        """Splice ticket ids into the cached template halves, template by template"""
+        templates = self.templates if examples is None else self.templates[:-1]
+        input_ids = [prefix + ids + suffix for prefix, suffix, glue in templates for ids, _ in tickets[glue]]
+        if examples is not None:
+            input_ids += [
+                self.few_shot_ids(ids, chosen) for (ids, _), chosen in zip(tickets[self._ticket_slot[2]], examples)
+            ]
+        return input_ids
+    
+    def _splices_exactly(self, samples):
+        """Whether spliced ids equal the tokenizer's ids for the whole prompts, with fixed and with per-ticket examples"""
+        tickets = self._ticket_ids(samples, None)
+        examples = [FEW_SHOT_EXAMPLES[1::-1]] * len(samples)
+        whole = [template(text) for template in self._template_fns for text in samples]
+        whole += [few_shot_prompt(text, chosen) for text, chosen in zip(samples, examples)]
+        spliced = self._assemble(tickets, None) + self._assemble(tickets, examples)[-len(samples):]
+        return spliced == self.tokenizer(whole).input_ids
+    
+    def encode(self, texts, token_budget=TICKET_TOKEN_BUDGET, examples=None):
+        """Return input ids for every template and ticket, template by template, and the tokens clipped per ticket
+        
+        `examples` can hold the few-shot examples to show for each ticket, in
+        place of the fixed FEW_SHOT_EXAMPLES of the last template.
+        """
+        texts = list(texts)
+        if not self.spliced:
+            return self._encode_whole(texts, token_budget, examples)
+        with TELEMETRY.stage("tokenize"):
+            tickets = self._ticket_ids(texts, token_budget)
+        with TELEMETRY.stage("prompt"):
+            input_ids = self._assemble(tickets, examples)
+        for ids in input_ids:
+            TELEMETRY.observe_tokens(len(ids))
+        if examples is not None:
+            # What the same prompts would have cost with the fixed examples, for before/after reporting
+            prefix, suffix, glue = self.templates[-1]
+            fixed = sum(len(prefix) + len(ids) + len(suffix) for ids, _ in tickets[glue])
+            TELEMETRY.count_few_shot_tokens(len(texts), fixed, sum(map(len, input_ids[-len(texts):])))
+        # Glue adds a token or two at most, so a ticket counts as clipped by its largest cut
+        clipped = [max(counts) for counts in zip(*([clipped for _, clipped in ids] for ids in tickets.values()))]
+        return input_ids, clipped
+    
+    def _encode_whole(self, texts, token_budget, examples):
+        """Tokenize whole prompts, for tokenizers whose ids cannot be spliced; clipped tickets are decoded back to text first"""
+        with TELEMETRY.stage("tokenize"):
+            tickets = [self.clip(ids, token_budget) for ids in self.tokenizer(texts, add_special_tokens=False).input_ids]
+            texts = [
+                self.tokenizer.decode(ids, skip_special_tokens=True) if dropped else text
+                for text, (ids, dropped) in zip(texts, tickets)
+            ]
+            templates = self._template_fns if examples is None else self._template_fns[:-1]
+            prompts = [template(text) for template in templates for text in texts]
+            if examples is not None:
+                prompts += [few_shot_prompt(text, chosen) for text, chosen in zip(texts, examples)]
+            input_ids = self.tokenizer(prompts).input_ids
+        for ids in input_ids:
+            TELEMETRY.observe_tokens(len(ids))
+        if examples is not None:
+            fixed = sum(map(len, self.tokenizer([self._template_fns[-1](text) for text in texts]).input_ids))
+            TELEMETRY.count_few_shot_tokens(len(texts), fixed, sum(map(len, input_ids[-len(texts):])))
+        return input_ids, [dropped for _, dropped in tickets]
+
+def prompt_encoder(tagger):
+    """Return the tagger's PromptEncoder, tokenizing the templates on first use"""
+    encoder = getattr(tagger, "prompt_encoder", None)
+    if encoder is None:
+        encoder = tagger.prompt_encoder = PromptEncoder(tagger.tokenizer)
+    return encoder
+
+# ============================================================================
+# INFERENCE MODES
+# ============================================================================
+def _padded(tagger, input_ids):
+    """Right-pad lists of input ids into input_ids and attention_mask tensors on the model's device"""
+    import torch
+    from transformers import BatchEncoding
+    
+    width = max(len(ids) for ids in input_ids)
+    padding = [[tagger.tokenizer.pad_token_id] * (width - len(ids)) for ids in input_ids]
+    return BatchEncoding({
+        'input_ids': torch.tensor([ids + pad for ids, pad in zip(input_ids, padding)]),
+        'attention_mask': torch.tensor([[1] * len(ids) + [0] * len(pad) for ids, pad in zip(input_ids, padding)])
+    }).to(tagger.model.device)
+
+def _generate(tagger, input_ids, batch_size, **generate_kwargs):
+    """Run the given prompt ids through the model as padded batches and return the generated texts"""
+    import torch
+    
+    texts = []
+    for start in range(0, len(input_ids), batch_size):
+        inputs = _padded(tagger, input_ids[start:start + batch_size])
+        with torch.no_grad(), TELEMETRY.forward():
+            # The pipeline's generation config carries its task defaults, as when calling tagger(prompts)
+            output_ids = tagger.model.generate(
+                **inputs, generation_config=getattr(tagger, "generation_config", None), **GENERATION_KWARGS,
+                **generate_kwargs
+            )
+        with TELEMETRY.stage("postprocess"):
+            # Decoded the way the text2text pipeline decodes, so outputs match tagger(prompts)
+            texts.extend(tagger.tokenizer.batch_decode(
+                output_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False
+            ))
+    return texts
+
+def _score(tagger, input_ids, batch_size):
+    """Score every tag in ALL_TAGS against each prompt by rank classification
+    
+    Each batch of prompts goes through the encoder once; the encoder states are
+    then repeated for all candidate tags so a single decoder pass yields the
+    log-likelihood of every tag. Scores are softmax-normalised over the tags.
+    """
+    import torch
+    from transformers.modeling_outputs import BaseModelOutput
+    
+    tokenizer, model = tagger.tokenizer, tagger.model
+    labels = tokenizer(ALL_TAGS, add_special_tokens=False, padding=True, return_tensors="pt").input_ids
+    labels[labels == tokenizer.pad_token_id] = -100
+    labels = labels.to(model.device)
+    # Decoder inputs are built here rather than from `labels=` so backends without a loss path work too
+    decoder_input_ids = torch.cat([
+        torch.full((len(ALL_TAGS), 1), model.config.decoder_start_token_id, device=model.device),
+        labels[:, :-1].masked_fill(labels[:, :-1] == -100, tokenizer.pad_token_id)
+    ], dim=1)
+    
+    scores = []
+    for start in range(0, len(input_ids), batch_size):
+        batch = input_ids[start:start + batch_size]
+        inputs = _padded(tagger, batch)
+        with torch.no_grad():
+            with TELEMETRY.stage("encode"):
+                hidden = model.get_encoder()(
+                    input_ids=inputs.input_ids, attention_mask=inputs.attention_mask
+                ).last_hidden_state
+            tag_labels = labels.repeat(len(batch), 1)
+            with TELEMETRY.stage("decode"):
+                logits = model(
+                    encoder_outputs=BaseModelOutput(last_hidden_state=hidden.repeat_interleave(len(ALL_TAGS), dim=0)),
+                    attention_mask=inputs.attention_mask.repeat_interleave(len(ALL_TAGS), dim=0),
+                    decoder_input_ids=decoder_input_ids.repeat(len(batch), 1)
+                ).logits
+            token_log_probs = logits.log_softmax(-1).gather(-1, tag_labels.clamp(min=0).unsqueeze(-1)).squeeze(-1)
+            tag_log_probs = token_log_probs.masked_fill(tag_labels == -100, 0.0).sum(-1)
+            probs = tag_log_probs.view(len(batch), len(ALL_TAGS)).softmax(-1)
+        scores.extend(
+            {tag: round(prob, 4) for tag, prob in zip(ALL_TAGS, row)} for row in probs.tolist()
+        )
+    return scores
+
+class _TrieNode:
+    """Node of a token trie over the tag vocabulary"""
+    def __init__(self):
+        self.children = {}
+        self.tag = None
+        self.tags = set()
+
+def _build_tag_trie(tokenizer):
+    """Build a token trie over ALL_TAGS and find the token ids of the comma separator"""
+    root = _TrieNode()
+    for tag in ALL_TAGS:
+        node = root
+        node.tags.add(tag)
+        for token_id in tokenizer(tag, add_special_tokens=False).input_ids:
+            node = node.children.setdefault(token_id, _TrieNode())
+            node.tags.add(tag)
+        node.tag = tag
+    
+    # Tokenize two tags joined by ", " so the separator ids match how they appear in context
+    first = tokenizer(ALL_TAGS[0], add_special_tokens=False).input_ids
+    second = tokenizer(ALL_TAGS[1], add_special_tokens=False).input_ids
+    joined = tokenizer(f"{ALL_TAGS[0]}, {ALL_TAGS[1]}", add_special_tokens=False).input_ids
+    separator = joined[len(first):len(joined) - len(second)]
+    return root, separator
+
+def _tag_prefix_fn(tokenizer, max_tags=3):
+    """Return a prefix_allowed_tokens_fn restricting decoding to distinct, comma-separated tags
+    
+    Decoding is forced to emit exactly `max_tags` tags from ALL_TAGS and ends
+    with EOS as soon as the last one is complete.
+    """
+    root, separator = _build_tag_trie(tokenizer)
+    eos = tokenizer.eos_token_id
+    
+    def allowed_tokens(batch_id, input_ids):
+        emitted = []
+        node = root
+        separator_pos = None
+        # Replay the tokens generated so far, skipping the decoder start token
+        for token_id in input_ids.tolist()[1:]:
+            if separator_pos is not None:
+                separator_pos += 1
+                if separator_pos == len(separator):
+                    node, separator_pos = root, None
+            elif token_id in node.children:
+                node = node.children[token_id]
+            elif node.tag is not None and token_id == separator[0]:
+                emitted.append(node.tag)
+                node, separator_pos = (root, None) if len(separator) == 1 else (None, 1)
+            else:
+                # EOS (or padding after it): the sequence is finished
+                return [eos]
+        
+        if separator_pos is not None:
+            return [separator[separator_pos]]
+        
+        allowed = [
+            token_id for token_id, child in node.children.items()
+            if child.tags.difference(emitted)
+        ]
+        if node.tag is not None and node.tag not in emitted:
+            allowed.append(eos if len(emitted) + 1 >= max_tags else separator[0])
+        return allowed or [eos]
+    
+    return allowed_tokens
+
+def _constrained_generate(tagger, input_ids, batch_size):
+    """Generate tags with decoding constrained to the tag vocabulary"""
+    return _generate(tagger, input_ids, batch_size, prefix_allowed_tokens_fn=_tag_prefix_fn(tagger.tokenizer))
+
+def _assisted_generate(tagger, input_ids, batch_size):
+    """Decode greedily with the draft model proposing tokens that the model verifies in one pass
+    
+    The output is the model's own greedy output; the draft only saves decoder
+    passes when its guesses are accepted. It can differ from the "generate"
+    mode, which uses beam search. Assisted generation handles one prompt at
+    a time, so `batch_size` is not used.
+    """
+    assistant = draft_model(tagger)
+    return [
+        text for ids in input_ids
+        for text in _generate(tagger, [ids], 1, assistant_model=assistant, num_beams=1)
+    ]
+
+# Inference functions by tagging mode, each taking lists of prompt input ids: free-form generation,
+# generation constrained to the tag vocabulary, rank classification over ALL_TAGS, or greedy
+# generation sped up by a draft model
+TAGGING_MODES = {
+    "generate": _generate,
+    "constrained": _constrained_generate,
+    "score": _score,
+    "greedy-assisted": _assisted_generate
+}
+
+# ============================================================================
+# TICKET PROCESSING
+# ============================================================================
+def _bucket_by_length(input_ids, batch_size):
+    """Group prompt indices into batches of similar token length to reduce padding"""
+    order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def _zero_shot_confirmed(output, keyword_tags):
+    """Whether a zero-shot output can stand in for the few-shot one
+    
+    It must hold 3 distinct valid tags, so validation has nothing to repair,
+    and at least ADAPTIVE_KEYWORD_AGREEMENT of them must be among the ticket's
+    keyword matches.
+    """
+    if isinstance(output, dict):
+        tags = sorted(output, key=output.get, reverse=True)[:3]
+    else:
+        tags = list(dict.fromkeys(tag.strip().lower() for tag in output.split(",")))
+        tags = [tag for tag in tags if tag in ALL_TAGS][:3]
+        if len(tags) < 3:
+            return False
+    return len(set(tags).intersection(keyword_tags)) >= ADAPTIVE_KEYWORD_AGREEMENT
+
+def _build_result(text, zs_output, fs_output, keyword_tags=None, clipped_tokens=0, adaptive=False):
+    """Turn raw model outputs into a result row with exactly 3 tags per prompt type
+    
+    Generated text is validated and repaired; tag score dicts from rank
+    classification are reduced to their top 3 tags and kept under `*_scores`.
+    A `fs_output` of None means the few-shot prompt was skipped: the zero-shot
+    tags are used for both. With `adaptive` set, `few_shot_skipped` records on
+    every result whether that happened. Tickets clipped to the token budget
+    record how many tokens were dropped.
+    """
+    result = {'text': text}
+    with TELEMETRY.stage("validate"):
+        for key, output in (('zero_shot', zs_output), ('few_shot', fs_output)):
+            if output is None:
+                result[key] = result['zero_shot']
+                if 'zero_shot_scores' in result:
+                    result[f'{key}_scores'] = result['zero_shot_scores']
+            elif isinstance(output, dict):
+                result[key] = ", ".join(sorted(output, key=output.get, reverse=True)[:3])
+                result[f'{key}_scores'] = output
+            else:
+                result[key] = validate_and_fix_tags(output, text, keyword_tags)
+    if adaptive:
+        # Set either way so every chunk of a streamed output has the column
+        result['few_shot_skipped'] = fs_output is None
+    if clipped_tokens:
+        result['clipped_tokens'] = clipped_tokens
+    result['timestamp'] = datetime.now().strftime("%H:%M:%S")
+    return result
+
+class _TaggingOptions:
+    """The process_tickets options its cache, near-duplicate and inference stages share"""
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, progress_callback=None, update_interval=0.5, mode="generate",
+                 cache=None, near_duplicates=None, token_budget=TICKET_TOKEN_BUDGET, adaptive=False, example_bank=None):
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.update_interval = update_interval
+        self.mode = mode
+        self.cache = cache
+        self.near_duplicates = near_duplicates
+        self.token_budget = token_budget
+        self.adaptive = adaptive
+        self.example_bank = example_bank
+
+def _cache_key(tagger, text, options):
+    """Hash everything that determines a result: ticket text, prompt templates and examples, token budget, model, backend and generation settings"""
+    example_bank = options.example_bank
+    payload = json.dumps({
+        'text': normalize_ticket_text(text),
+        'templates': [zero_shot_prompt(TICKET_PLACEHOLDER), few_shot_prompt(TICKET_PLACEHOLDER)],
+        'token_budget': options.token_budget,
+        'model': getattr(tagger, "model_id", None) or tagger.model.config.name_or_path,
+        'backend': getattr(tagger, "backend", "torch"),
+        'generation': GENERATION_KWARGS,
+        'mode': options.mode,
+        'adaptive': options.adaptive,
+        'examples': example_bank.fingerprint() if example_bank is not None else None
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _cache_entry(result):
+    """Strip the per-request fields from a result before storing it"""
+    return {key: value for key, value in result.items() if key not in ('text', 'timestamp')}
+
+def _result_from_cache(text, entry):
+    """Rebuild a result row from a cached entry"""
+    return {'text': text, **entry, 'timestamp': datetime.now().strftime("%H:%M:%S")}
+
+def _student_result(text, tags, confidence):
+    """Build a result row from the student's predicted tags"""
+    return {
+        'text': text,
+        **{key: ", ".join(key_tags) for key, key_tags in tags.items()},
+        'tagged_by': "student",
+        'student_confidence': round(confidence, 4),
+        'timestamp': datetime.now().strftime("%H:%M:%S")
+    }
+
+def _cascade(texts, student, tag_routed):
+    """Answer the tickets the student is confident about and pass the rest to `tag_routed`, in input order"""
+    with TELEMETRY.stage("student"):
+        predictions = student.predict(texts)
+    routed = [i for i, (_, confidence) in enumerate(predictions) if confidence < student.threshold]
+    tagged = dict(zip(routed, tag_routed([texts[i] for i in routed])))
+    return [
+        {**tagged[i], 'tagged_by': "model", 'student_confidence': round(confidence, 4)} if i in tagged
+        else _student_result(text, tags, confidence)
+        for i, (text, (tags, confidence)) in enumerate(zip(texts, predictions))
+    ]
+
+def process_ticket(tagger, text, fused=True, mode="generate", cache=None, token_budget=TICKET_TOKEN_BUDGET,
+                   student=None, adaptive=False, example_bank=None):
+    """Process a single ticket and return results with exactly 3 valid tags
+    
+    This is `process_tickets` on a one-ticket batch and takes the same
+    options. With `fused` set, the zero-shot and few-shot prompts are stacked
+    into one padded model call instead of two sequential model calls.
+    """
+    return process_tickets(
+        tagger, [text], batch_size=2 if fused else 1, mode=mode, cache=cache, token_budget=token_budget,
+        student=student, adaptive=adaptive, example_bank=example_bank
+    )[0]
+
+def process_tickets(tagger, texts, batch_size=DEFAULT_BATCH_SIZE, progress_callback=None, update_interval=0.5,
+                    mode="generate", cache=None, near_duplicates=None, token_budget=TICKET_TOKEN_BUDGET, student=None,
+                    adaptive=False, example_bank=None):
+    """Process many tickets with batched generation, returning results in input order
+    
+    Zero-shot and few-shot prompts are sorted by token length and sent to the
+    model in buckets of `batch_size`, so each generate call pads to a similar
+    length. Tickets longer than `token_budget` tokens are clipped, and their
+    results carry the number of tokens dropped as `clipped_tokens`.
+    `progress_callback(done, total)` is called with prompt counts at most
+    once every `update_interval` seconds, and always after the last batch.
+    With a StudentClassifier as `student`, tickets it is confident about are
+    answered by it and only the rest go on; results then say who tagged them
+    in `tagged_by` ("student" or "model") along with the `student_confidence`.
+    With `adaptive` set, few-shot prompts run only for tickets whose zero-shot
+    tags needed repair or disagree with their keywords; the rest reuse the
+    zero-shot tags, and every result says which in `few_shot_skipped`. With
+    an ExampleBank as `example_bank`, each few-shot prompt shows the bank's
+    examples most similar to its ticket instead of the fixed ones.
+    When a `cache` is given, cached tickets and repeats within `texts` skip the model.
+    When a NearDuplicateGrouper is given as `near_duplicates`, the remaining tickets
+    are grouped and only one per group is tagged; the others copy its tags and
+    are marked with `near_duplicate_of`.
+    """
+    texts = list(texts)
+    start = time.perf_counter()
+    options = _TaggingOptions(
+        batch_size=batch_size, progress_callback=progress_callback, update_interval=update_interval, mode=mode,
+        cache=cache, near_duplicates=near_duplicates, token_budget=token_budget, adaptive=adaptive,
+        example_bank=example_bank
+    )
+    
+    def tag(texts):
+        return _process_with_cache(tagger, texts, options)
+    
+    results = tag(texts) if student is None else _cascade(texts, student, tag)
+    TELEMETRY.count_tickets(len(texts))
+    TELEMETRY.log(
+        "process_tickets", tickets=len(texts), mode=mode, batch_size=batch_size, seconds=time.perf_counter() - start
+    )
+    return results
+
+def _process_with_cache(tagger, texts, options):
+    """Serve what the cache holds and run the model on the rest, in input order"""
+    cache = options.cache
+    if cache is None:
+        return _infer_representatives(tagger, texts, options)
+    
+    keys = [_cache_key(tagger, text, options) for text in texts]
+    cached = cache.get_many(keys)
+    
+    # Run the model once per distinct uncached key
+    pending = {}
+    for i, key in enumerate(keys):
+        if key not in cached:
+            pending.setdefault(key, i)
+    fresh = _infer_representatives(tagger, [texts[i] for i in pending.values()], options)
+    fresh_entries = {key: _cache_entry(result) for key, result in zip(pending, fresh)}
+    # Tags copied from a near-duplicate are not the model's answer for this text, so they are not cached
+    new_entries = {key: entry for key, entry in fresh_entries.items() if 'near_duplicate_of' not in entry}
+    if new_entries:
+        cache.put_many(new_entries)
+    
+    fresh_by_index = dict(zip(pending.values(), fresh))
+    return [
+        fresh_by_index[i] if i in fresh_by_index else _result_from_cache(text, cached.get(key) or fresh_entries[key])
+        for i, (text, key) in enumerate(zip(texts, keys))
+    ]
+
+def _infer_representatives(tagger, texts, options):
+    """Tag one representative per near-duplicate group and copy its tags to the other members"""
+    if options.near_duplicates is None:
+        return _infer_tickets(tagger, texts, options)
+    
+    leaders = options.near_duplicates.group(texts)
+    representatives = sorted(set(leaders))
+    inferred = dict(zip(representatives, _infer_tickets(tagger, [texts[i] for i in representatives], options)))
+    return [
+        inferred[i] if leader == i else {**inferred[leader], 'text': texts[i], 'near_duplicate_of': texts[leader]}
+        for i, leader in enumerate(leaders)
+    ]
+
+def _examples(example_bank, texts):
+    """The few-shot examples the bank picks for each text, or None to show the fixed ones"""
+    if example_bank is None:
+        return None
+    with TELEMETRY.stage("retrieve"):
+        return example_bank.select(texts)
+
+def _infer_tickets(tagger, texts, options):
+    """Run the model over all tickets in length-sorted buckets and build results in input order
+    
+    With `options.adaptive` set, the zero-shot prompts run first and a ticket's
+    few-shot prompt runs only when `_zero_shot_confirmed` rejects its
+    zero-shot output. Skipped prompts count as done for progress reporting.
+    """
+    if not texts:
+        return []
+    
+    input_ids, clipped_tokens = prompt_encoder(tagger).encode(
+        texts, options.token_budget, _examples(options.example_bank, texts)
+    )
+    TELEMETRY.count_clipped(sum(map(bool, clipped_tokens)))
+    outputs = [None] * len(input_ids)
+    
+    done = 0
+    last_update = time.monotonic()
+    
+    def advance(count):
+        nonlocal done, last_update
+        done += count
+        now = time.monotonic()
+        if options.progress_callback and (done == len(input_ids) or now - last_update >= options.update_interval):
+            options.progress_callback(done, len(input_ids))
+            last_update = now
+    
+    def run(indices):
+        for bucket in _bucket_by_length([input_ids[i] for i in indices], options.batch_size):
+            bucket = [indices[j] for j in bucket]
+            generated = TAGGING_MODES[options.mode](tagger, [input_ids[i] for i in bucket], batch_size=len(bucket))
+            for i, output in zip(bucket, generated):
+                outputs[i] = output
+            advance(len(bucket))
+    
+    def match_keywords():
+        # Keyword fallback evidence for the whole batch in one pass
+        with TELEMETRY.stage("keywords"):
+            return KEYWORDS.match_series(pd.Series(texts)).tolist()
+    
+    n = len(texts)
+    if options.adaptive:
+        run(range(n))
+        keyword_tags = match_keywords()
+        routed = [n + i for i in range(n) if not _zero_shot_confirmed(outputs[i], keyword_tags[i])]
+        advance(n - len(routed))
+        run(routed)
+    else:
+        run(range(len(input_ids)))
+        keyword_tags = match_keywords() if options.mode != "score" else [None] * n
+    return [
+        _build_result(text, outputs[i], outputs[n + i], keyword_tags[i], clipped_tokens[i], options.adaptive)
+        for i, text in enumerate(texts)
+    ]
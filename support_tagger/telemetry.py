@@ -0,0 +1,264 @@
+"""Per-stage timings, prompt token counts and throughput for the tagging pipeline
+
+Everything is recorded in the process-wide TELEMETRY object as Prometheus-style
+histograms. It can be read as a dict, dumped in the Prometheus text format, or
+followed as JSON lines on the "support_tagger.telemetry" logger. Set
+SUPPORT_TAGGER_TELEMETRY=0, or TELEMETRY.enabled = False, to stop recording.
+"""
+import bisect
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+# Stages in pipeline order, as shown in reports
+STAGES = ("read", "student", "retrieve", "prompt", "tokenize", "encode", "decode", "postprocess", "keywords", "validate", "write", "render")
+
+# Upper bounds of the stage timing buckets, in seconds
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the prompt length buckets, in tokens
+TOKEN_BUCKETS = (16, 32, 64, 96, 128, 192, 256, 384, 512, 1024)
+
+# Seconds of recent ticket completions the throughput rate is computed over
+THROUGHPUT_WINDOW = 60
+
+logger = logging.getLogger("support_tagger.telemetry")
+
+class Histogram:
+    """Bucket counts with a running sum and count, as in a Prometheus histogram"""
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, capped at the largest bound"""
+        if not self.count:
+            return 0.0
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= q * self.count:
+                return bound
+        return self.bounds[-1]
+
+class Telemetry:
+    """Thread-safe recorder for stage timings, prompt lengths and ticket throughput"""
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+    
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._stages = {}
+            self._tokens = Histogram(TOKEN_BUCKETS)
+            self._tickets = 0
+            self._clipped = 0
+            # Few-shot prompts built with retrieved examples, and their tokens with fixed and retrieved examples
+            self._few_shot = [0, 0, 0]
+            self._completions = deque()
+            self._started = time.monotonic()
+    
+    @contextlib.contextmanager
+    def _timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def stage(self, stage):
+        """Context manager that times one stage; does nothing while disabled"""
+        return self._timer(stage) if self.enabled else contextlib.nullcontext()
+    
+    @contextlib.contextmanager
+    def _forward_timer(self):
+        local = self._local
+        local.encode_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            encode = local.encode_seconds
+            if encode:
+                self.observe("encode", encode)
+            self.observe("decode", elapsed - encode)
+    
+    def forward(self):
+        """Context manager that times one model call, split into encode and decode by the hooks `instrument` adds"""
+        return self._forward_timer() if self.enabled else contextlib.nullcontext()
+    
+    def observe(self, stage, seconds):
+        """Record one timing for a stage"""
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(SECONDS_BUCKETS)
+            histogram.observe(seconds)
+    
+    def observe_tokens(self, tokens):
+        """Record the token length of one prompt"""
+        if self.enabled:
+            with self._lock:
+                self._tokens.observe(tokens)
+    
+    def count_tickets(self, count):
+        """Record that `count` tickets were tagged"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._tickets += count
+            self._completions.append((now, count))
+            while self._completions and self._completions[0][0] < now - THROUGHPUT_WINDOW:
+                self._completions.popleft()
+    
+    def count_clipped(self, count):
+        """Record that `count` tickets were clipped to the token budget"""
+        if self.enabled and count:
+            with self._lock:
+                self._clipped += count
+    
+    def count_few_shot_tokens(self, prompts, fixed_tokens, retrieved_tokens):
+        """Record few-shot prompts built with retrieved examples and their token totals with fixed and retrieved examples"""
+        if self.enabled and prompts:
+            with self._lock:
+                for i, value in enumerate((prompts, fixed_tokens, retrieved_tokens)):
+                    self._few_shot[i] += value
+    
+    def tickets_per_second(self):
+        """Tagging rate over the last THROUGHPUT_WINDOW seconds"""
+        now = time.monotonic()
+        with self._lock:
+            recent = sum(count for stamp, count in self._completions if stamp >= now - THROUGHPUT_WINDOW)
+            span = min(THROUGHPUT_WINDOW, now - self._started)
+        return recent / span if span > 0 else 0.0
+    
+    def log(self, event, **fields):
+        """Emit one JSON log line on the telemetry logger"""
+        if self.enabled and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'event': event, 'time': time.time(), **fields}))
+    
+    def snapshot(self):
+        """Return every recorded metric as a JSON-ready dict, with stages in pipeline order"""
+        with self._lock:
+            stages = dict(self._stages)
+            tokens = self._tokens
+            tickets = self._tickets
+            clipped = self._clipped
+            prompts, fixed, retrieved = self._few_shot
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return {
+            'tickets': tickets,
+            'tickets_per_second': self.tickets_per_second(),
+            'tickets_clipped': clipped,
+            'few_shot_tokens': {
+                'prompts': prompts,
+                'fixed_mean': fixed / prompts if prompts else 0.0,
+                'retrieved_mean': retrieved / prompts if prompts else 0.0
+            },
+            'stages': {
+                stage: {
+                    'count': histogram.count,
+                    'total_seconds': histogram.sum,
+                    'mean_ms': histogram.sum / histogram.count * 1000,
+                    'p50_ms': histogram.quantile(0.5) * 1000,
+                    'p95_ms': histogram.quantile(0.95) * 1000,
+                    'buckets': dict(zip([*map(str, histogram.bounds), "+Inf"], histogram.counts))
+                }
+                for stage, histogram in sorted(stages.items(), key=lambda item: order.get(item[0], len(order)))
+            },
+            'prompt_tokens': {
+                'count': tokens.count,
+                'mean': tokens.sum / tokens.count if tokens.count else 0.0,
+                'p50': tokens.quantile(0.5),
+                'p95': tokens.quantile(0.95),
+                'buckets': dict(zip([*map(str, tokens.bounds), "+Inf"], tokens.counts))
+            }
+        }
+    
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            stages = {stage: (list(h.counts), h.sum, h.count) for stage, h in self._stages.items()}
+            tokens = (list(self._tokens.counts), self._tokens.sum, self._tokens.count)
+            tickets = self._tickets
+            clipped = self._clipped
+            prompts, fixed, retrieved = self._few_shot
+        
+        def histogram_lines(name, bounds, counts, total, count, labels=""):
+            lines, cumulative = [], 0
+            for bound, bucket in zip([*map(str, bounds), "+Inf"], counts):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines += [f"{name}_sum{suffix} {total}", f"{name}_count{suffix} {count}"]
+            return lines
+        
+        lines = [
+            "# HELP support_tagger_stage_seconds Time spent in each tagging stage",
+            "# TYPE support_tagger_stage_seconds histogram"
+        ]
+        for stage, (counts, total, count) in stages.items():
+            lines += histogram_lines("support_tagger_stage_seconds", SECONDS_BUCKETS, counts, total, count, f'stage="{stage}"')
+        lines += [
+            "# HELP support_tagger_prompt_tokens Prompt length in tokens",
+            "# TYPE support_tagger_prompt_tokens histogram",
+            *histogram_lines("support_tagger_prompt_tokens", TOKEN_BUCKETS, *tokens),
+            "# HELP support_tagger_tickets_total Tickets tagged",
+            "# TYPE support_tagger_tickets_total counter",
+            f"support_tagger_tickets_total {tickets}",
+            "# HELP support_tagger_tickets_clipped_total Tickets clipped to the token budget",
+            "# TYPE support_tagger_tickets_clipped_total counter",
+            f"support_tagger_tickets_clipped_total {clipped}",
+            "# HELP support_tagger_few_shot_prompt_tokens_total Tokens of few-shot prompts built with retrieved examples, "
+            "and what the fixed examples would have cost",
+            "# TYPE support_tagger_few_shot_prompt_tokens_total counter",
+            f'support_tagger_few_shot_prompt_tokens_total{{examples="fixed"}} {fixed}',
+            f'support_tagger_few_shot_prompt_tokens_total{{examples="retrieved"}} {retrieved}',
+            "# HELP support_tagger_tickets_per_second Tickets tagged per second over the recent window",
+            "# TYPE support_tagger_tickets_per_second gauge",
+            f"support_tagger_tickets_per_second {self.tickets_per_second()}"
+        ]
+        return "\n".join(lines) + "\n"
+    
+    def instrument(self, tagger):
+        """Add encoder hooks to a pipeline's model so `forward` can tell encoding from decoding
+        
+        Backends whose encoder is not a torch module report all of a model call
+        as decoding.
+        """
+        if getattr(tagger, "_telemetry", None) is self:
+            return tagger
+        local = self._local
+        
+        import torch
+        encoder = tagger.model.get_encoder() if hasattr(tagger.model, "get_encoder") else None
+        if isinstance(encoder, torch.nn.Module):
+            def before_encoder(module, args):
+                local.encoder_start = time.perf_counter()
+            
+            def after_encoder(module, args, output):
+                local.encode_seconds = getattr(local, "encode_seconds", 0.0) + time.perf_counter() - local.encoder_start
+            
+            encoder.register_forward_pre_hook(before_encoder)
+            encoder.register_forward_hook(after_encoder)
+        tagger._telemetry = self
+        return tagger
+
+# Shared recorder for the process; on unless SUPPORT_TAGGER_TELEMETRY=0
+TELEMETRY = Telemetry(enabled=os.environ.get("SUPPORT_TAGGER_TELEMETRY", "1") != "0")